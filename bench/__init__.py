@@ -0,0 +1,12 @@
+"""
+    Benchmarks for the chapter implementations.
+
+        python -m bench --chapters 3-6 --statements 10,100,1000 -o results.json
+        python -m bench --baseline results.json    # exits 1 on a regression
+
+    `gen` makes synthetic Simple programs, `worker` measures them with one
+    chapter's parser, and `python -m bench` drives both and writes the
+    results as JSON.  The standalone scripts next to them time single
+    operations of chapter 6.
+"""
+from .gen import ProgramGenerator
@@ -0,0 +1,108 @@
+"""
+    Generate programs, measure them with every chapter, write JSON results
+    and optionally compare them to a baseline.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from .gen import ProgramGenerator
+from .worker import ROOT
+
+# Summary metrics compared against a baseline
+METRICS = ("parse_s", "peephole_s", "nodes", "peak_bytes")
+
+def chapters(spec):
+    out = []
+    for part in spec.split(","):
+        lo, _, hi = part.partition("-")
+        out.extend(range(int(lo), int(hi or lo) + 1))
+    return out
+
+def run_chapter(chapter, programs, repeat, timeout):
+    job = json.dumps({"programs": programs, "repeat": repeat, "timeout": timeout})
+    res = subprocess.run([sys.executable, "-m", "bench.worker", str(chapter)], input=job, capture_output=True,
+                         text=True, cwd=ROOT)
+    if res.returncode != 0:
+        raise RuntimeError(f"chapter {chapter} worker failed:\n{res.stderr}")
+    return json.loads(res.stdout)
+
+def summarize(results):
+    summary = {}
+    for r in results:
+        s = summary.setdefault(str(r["chapter"]), {m: 0 for m in METRICS} | {"programs": 0, "errors": 0})
+        s["programs"] += 1
+        if r["error"]:
+            s["errors"] += 1
+            continue
+        for m in METRICS:
+            if r[m] is None: continue
+            s[m] = max(s[m], r[m]) if m == "peak_bytes" else s[m] + r[m]
+    return summary
+
+def compare(summary, baseline, threshold):
+    """
+        @return one message per chapter metric that grew by more than threshold
+    """
+    bad = []
+    for ch, s in summary.items():
+        b = baseline["summary"].get(ch)
+        if b is None: continue
+        for m in METRICS:
+            if b.get(m) and s[m] > b[m] * threshold:
+                bad.append(f"chapter {ch} {m}: {b[m]:.6g} -> {s[m]:.6g} ({s[m] / b[m]:.2f}x)")
+        if s["errors"] > b.get("errors", 0):
+            bad.append(f"chapter {ch} errors: {b.get('errors', 0)} -> {s['errors']}")
+    return bad
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog="python -m bench", description=__doc__)
+    ap.add_argument("--chapters", default="1-6", help="e.g. 2-6 or 3,6")
+    ap.add_argument("--statements", default="10,100", help="comma separated program sizes")
+    ap.add_argument("--expr-len", type=int, default=4)
+    ap.add_argument("--if-depth", type=int, default=2)
+    ap.add_argument("--num-vars", type=int, default=8)
+    ap.add_argument("--scope-depth", type=int, default=2)
+    ap.add_argument("--shared-ratio", type=float, default=0.2)
+    ap.add_argument("--programs", type=int, default=3, help="programs per size, with different seeds")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--repeat", type=int, default=3, help="timed parses per program, the best counts")
+    ap.add_argument("--timeout", type=float, default=30, help="seconds allowed per program, 0 for no limit")
+    ap.add_argument("-o", "--output", help="write the JSON results here instead of stdout")
+    ap.add_argument("--baseline", help="JSON results to compare against")
+    ap.add_argument("--threshold", type=float, default=1.25, help="allowed growth over the baseline")
+    args = ap.parse_args(argv)
+
+    results = []
+    for ch in chapters(args.chapters):
+        gens = [ProgramGenerator(ch, n, args.expr_len, args.if_depth, args.num_vars, args.scope_depth,
+                                 args.shared_ratio, args.seed + i)
+                for n in map(int, args.statements.split(",")) for i in range(args.programs)]
+        for g, r in zip(gens, run_chapter(ch, [g.generate() for g in gens], args.repeat, args.timeout)):
+            results.append({"chapter": ch, "seed": g.seed, **g.knobs(), **r})
+    doc = {
+        "meta": {"time": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": platform.python_version(),
+                 "platform": platform.platform(), "args": vars(args)},
+        "summary": summarize(results),
+        "results": results,
+    }
+    text = json.dumps(doc, indent=1)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            bad = compare(doc["summary"], json.load(f), args.threshold)
+        for msg in bad:
+            print("REGRESSION " + msg, file=sys.stderr)
+        return 1 if bad else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
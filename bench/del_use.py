@@ -0,0 +1,38 @@
+"""
+    Def-use edge benchmark: create N ConstantNodes, all uses of START, then
+    kill them in random order.  Each kill removes one use from START, so the
+    total time should grow linearly with N.
+
+    usage: python bench/del_use.py [max_count]
+"""
+import os
+import random
+import sys
+import time
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "chapter6"))
+from myparser.parser import Parser
+from myparser.node import ConstantNode
+from myparser.type import TypeInteger
+
+def run(count):
+    parser = Parser("return arg;")
+    with parser.ctx:
+        cons = [ConstantNode(TypeInteger.constant(i)) for i in range(count)]
+        random.Random(count).shuffle(cons)
+        st = time.perf_counter()
+        for con in cons:
+            con.kill()
+        elapsed = time.perf_counter() - st
+    assert parser.START.isUnused()
+    return elapsed
+
+def main(max_count):
+    print(f"{'constants':>10}{'kill (s)':>12}{'us/kill':>10}")
+    count = max_count // 8
+    while count <= max_count:
+        t = run(count)
+        print(f"{count:>10}{t:>12.3f}{t / count * 1e6:>10.2f}")
+        count *= 2
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
@@ -0,0 +1,134 @@
+"""
+    Synthetic Simple programs of controllable size and shape.
+
+    The programs only use the language of the chapter they are made for:
+    chapter 1 returns a literal; 2 adds arithmetic; 3 variables and
+    nested scopes; 4 `arg` and comparisons; 5 and up `if`/`else`.  Knobs a
+    chapter cannot use are ignored.  Divisions are by non-zero literals
+    only, so every program compiles in every chapter.
+"""
+import random
+
+class ProgramGenerator():
+    """
+        Makes Simple programs; the same knobs and seed give the same program.
+
+        @param chapter the chapter the programs are for
+        @param statements number of statements, roughly
+        @param expr_len terms per expression
+        @param if_depth maximum nesting of `if` statements
+        @param num_vars number of distinct variable names
+        @param scope_depth maximum nesting of `{}` blocks
+        @param shared_ratio chance a term repeats an earlier subexpression
+    """
+    KNOBS = ("statements", "expr_len", "if_depth", "num_vars", "scope_depth", "shared_ratio")
+    COMPARE = ("==", "!=", "<", "<=", ">", ">=")
+    # Chapters 4 and 5 match '<' before '<=', so cannot parse '<=' or '>='
+    COMPARE_OLD = ("==", "!=", "<", ">")
+
+    def __init__(self, chapter=6, statements=20, expr_len=4, if_depth=2, num_vars=8, scope_depth=2,
+                 shared_ratio=0.2, seed=0):
+        self.chapter = chapter
+        self.statements = statements
+        self.expr_len = expr_len
+        self.if_depth = if_depth
+        self.num_vars = num_vars
+        self.scope_depth = scope_depth
+        self.shared_ratio = shared_ratio
+        self.seed = seed
+
+    def knobs(self):
+        return {k: getattr(self, k) for k in self.KNOBS}
+
+    def generate(self) -> str:
+        self._rnd = random.Random(self.seed)
+        if self.chapter <= 1:
+            return f"return {self._rnd.randint(1, 100)};"
+        if self.chapter == 2:
+            self._scopes = [set()]
+            self._pools = [[]]
+            return f"return {self._expr(self.expr_len)};"
+        self._scopes = [set()]  # names declared, by scope
+        self._pools = [[]]      # subexpressions made, by scope
+        self._budget = self.statements
+        out = []
+        while self._budget > 0:
+            self._statement(out, 0, 0, 0)
+        out.append(f"return {self._expr(self.expr_len)};")
+        return "\n".join(out)
+
+    # --------------------------------------
+    # Statements
+
+    def _statement(self, out, indent, scopes, ifs):
+        self._budget -= 1
+        pad = "  " * indent
+        r = self._rnd.random()
+        if self.chapter >= 5 and ifs < self.if_depth and r < 0.2:
+            out.append(f"{pad}if( {self._compare()} )")
+            self._block(out, indent, scopes, ifs + 1)
+            if self._rnd.random() < 0.5:
+                out.append(f"{pad}else")
+                self._block(out, indent, scopes, ifs + 1)
+        elif scopes < self.scope_depth and r < 0.35:
+            self._block(out, indent, scopes + 1, ifs)
+        else:
+            visible = self._visible()
+            fresh = [f"v{i}" for i in range(self.num_vars) if f"v{i}" not in self._scopes[-1]]
+            if fresh and (not visible or self._rnd.random() < 0.5):
+                name = self._rnd.choice(fresh)
+                out.append(f"{pad}int {name}={self._expr(self.expr_len)};")
+                self._scopes[-1].add(name)
+            elif visible:
+                out.append(f"{pad}{self._rnd.choice(visible)}={self._expr(self.expr_len)};")
+
+    def _block(self, out, indent, scopes, ifs):
+        pad = "  " * indent
+        out.append(pad + "{")
+        self._scopes.append(set())
+        self._pools.append([])
+        for _ in range(self._rnd.randint(1, 4)):
+            if self._budget <= 0: break
+            self._statement(out, indent + 1, scopes, ifs)
+        self._scopes.pop()
+        self._pools.pop()
+        out.append(pad + "}")
+
+    def _visible(self):
+        return sorted(set().union(*self._scopes))
+
+    # --------------------------------------
+    # Expressions
+
+    def _compare(self):
+        n = max(1, self.expr_len // 2)
+        return f"{self._expr(n)}{self._rnd.choice(self._compares())}{self._expr(n)}"
+
+    def _compares(self):
+        return self.COMPARE if self.chapter >= 6 else self.COMPARE_OLD
+
+    def _expr(self, n):
+        if n <= 1:
+            return self._term()
+        k = self._rnd.randint(1, n - 1)
+        op = self._rnd.choice("+-*/")
+        if op == "/":
+            e = f"({self._expr(n - 1)}/{self._rnd.randint(1, 9)})"
+        else:
+            e = f"({self._expr(k)}{op}{self._expr(n - k)})"
+        self._pools[-1].append(e)
+        return e
+
+    def _term(self):
+        rnd = self._rnd
+        pool = [e for p in self._pools for e in p]
+        if pool and rnd.random() < self.shared_ratio:
+            return rnd.choice(pool)
+        choices = ["lit"]
+        if self.chapter >= 3 and self._visible(): choices.append("var")
+        if self.chapter >= 4: choices += ["arg", "cmp"]
+        kind = rnd.choice(choices)
+        if kind == "var": return rnd.choice(self._visible())
+        if kind == "arg": return "arg"
+        if kind == "cmp": return f"({self._term()}{rnd.choice(self._compares())}{self._term()})"
+        return f"-{rnd.randint(1, 100)}" if self.chapter >= 2 and rnd.random() < 0.1 else str(rnd.randint(1, 100))
@@ -0,0 +1,55 @@
+"""
+    Memory benchmark: bytes per node for the chapter6 node classes.
+
+    Builds many nodes of each kind and reports the traced allocation per node,
+    including its share of the def-use edge lists (and of the GVN table, for
+    peepholed nodes).
+
+    usage: python bench/node_memory.py [count]
+"""
+import os
+import sys
+import tracemalloc
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "chapter6"))
+from myparser.parser import Parser
+from myparser.node import AddNode, MulNode, ConstantNode, ProjNode, PhiNode, RegionNode, ScopeNode
+from myparser.type import TypeInteger
+
+def measure(make, count):
+    nodes = [None] * count
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    for i in range(count):
+        nodes[i] = make(i)
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return (after - before) / count
+
+def main(count):
+    parser = Parser("return arg;")
+    with parser.ctx:
+        run(parser, count)
+
+def run(parser, count):
+    start = parser.START
+    x = ProjNode(start, 1, "arg").peephole()
+    y = ProjNode(start, 1, "arg")
+    region = RegionNode(None, x, y)
+    cons = [TypeInteger.constant(i) for i in range(count)]
+    con_nodes = [ConstantNode(TypeInteger.constant(i + 2)).peephole() for i in range(count)]
+    kinds = [
+        ("AddNode", lambda i: AddNode(x, y)),
+        ("ConstantNode", lambda i: ConstantNode(cons[i])),
+        ("ProjNode", lambda i: ProjNode(start, 1, "arg")),
+        ("PhiNode", lambda i: PhiNode("a", region, x, y)),
+        ("ScopeNode", lambda i: ScopeNode()),
+        # Includes the node's share of the GVN table
+        ("MulNode+GVN", lambda i: MulNode(x, con_nodes[i]).peephole()),
+    ]
+    print(f"{'node':<14}{'bytes/node':>12}")
+    for name, make in kinds:
+        print(f"{name:<14}{measure(make, count):>12.1f}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
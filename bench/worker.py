@@ -0,0 +1,122 @@
+"""
+    Measures programs with one chapter's parser.  Every chapter names its
+    package `myparser`, so each chapter is measured in its own process:
+
+        python -m bench.worker <chapter> < programs.json > results.json
+
+    Reads a JSON object {"programs": [...], "repeat": n, "timeout": s} and
+    writes a JSON list with one result per program.  A program still being
+    measured after `timeout` seconds gets the error "Timeout"; some of the
+    older chapters take exponential time on shared subexpressions.
+"""
+import json
+import os
+import signal
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+class ChapterRunner():
+    """
+        Parses with the Parser of one chapter, hiding the differences between
+        the chapters: how to switch off the peepholes and count nodes.
+    """
+    def __init__(self, chapter):
+        self.chapter = chapter
+        sys.path.insert(0, os.path.join(ROOT, f"chapter{chapter}"))
+        from myparser.parser import Parser
+        self.Parser = Parser
+        if chapter < 6:
+            from myparser.node import Node
+            self.Node = Node
+        else:
+            from myparser.batch import count_live
+            self.count_live = count_live
+
+    def parse(self, src, peephole=True):
+        """
+            @return the parse result and the number of nodes created
+        """
+        parser = self.Parser(src)
+        if self.chapter >= 6:
+            parser.ctx.disable_peephole = not peephole
+            return parser.parse(), parser.ctx.node_count() - 1
+        if self.chapter >= 2:
+            self.Node._disablePeephole = not peephole # Parser() resets it
+        try:
+            res = parser.parse()
+        finally:
+            if self.chapter >= 2:
+                self.Node._disablePeephole = False
+        # Chapter 1 does not count its nodes
+        return res, self.Node._unique_id - 1 if self.chapter >= 2 else None
+
+    def measure(self, src, repeat=3, timeout=None):
+        r = {"parse_s": None, "nopeep_s": None, "peephole_s": None, "nodes": None, "live": None,
+             "peak_bytes": None, "error": None}
+        if timeout:
+            signal.setitimer(signal.ITIMER_REAL, timeout)
+        try:
+            r["parse_s"] = self._best(src, True, repeat)
+            if self.chapter >= 2:
+                r["nopeep_s"] = self._best(src, False, repeat)
+                # The peepholes run interleaved with parsing; this is their share
+                r["peephole_s"] = max(r["parse_s"] - r["nopeep_s"], 0.0)
+            res, r["nodes"] = self.parse(src)
+            r["live"] = self.count_live(res)
+            tracemalloc.start()
+            try:
+                self.parse(src)
+                r["peak_bytes"] = tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+        except Timeout:
+            r["error"] = "Timeout"
+        except Exception as e:
+            r["error"] = f"{type(e).__name__}: {e}"
+        finally:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+        return r
+
+    def _best(self, src, peephole, repeat):
+        best = None
+        for _ in range(repeat):
+            st = time.perf_counter()
+            self.parse(src, peephole)
+            t = time.perf_counter() - st
+            best = t if best is None else min(best, t)
+        return best
+
+    def count_live(self, root):
+        """
+            Nodes reachable from root by inputs.  Chapter 6 counts with its
+            Walker; older chapters have no Walker, and chapter 1 gives every
+            node the same id, so they are told apart by identity.
+        """
+        seen = {id(root)}
+        stack = [root]
+        while stack:
+            for d in stack.pop()._inputs:
+                if d is not None and id(d) not in seen:
+                    seen.add(id(d))
+                    stack.append(d)
+        return len(seen)
+
+class Timeout(BaseException):
+    # Not an Exception, so the parsers cannot catch it
+    pass
+
+def _timeout(signum, frame):
+    raise Timeout()
+
+def main():
+    sys.setrecursionlimit(max(sys.getrecursionlimit(), 20000)) # Older chapters recurse per node
+    signal.signal(signal.SIGALRM, _timeout)
+    runner = ChapterRunner(int(sys.argv[1]))
+    job = json.load(sys.stdin)
+    json.dump([runner.measure(src, job.get("repeat", 3), job.get("timeout")) for src in job["programs"]], sys.stdout)
+
+if __name__ == "__main__":
+    main()
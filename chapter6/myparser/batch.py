@@ -0,0 +1,74 @@
+import os
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from myparser.parser import Parser
+from myparser.utils import Walker, inputs
+
+# The outcome of compiling one source, small enough to ship between processes.
+#   index   position of the source in the input
+#   printed the printed return expression, `None` on error
+#   nodes   live nodes reachable from STOP
+#   created nodes created while compiling, including the ones optimized away
+#   error   the error message, `None` on success
+CompileResult = namedtuple("CompileResult", ["index", "printed", "nodes", "created", "error"])
+
+def compile_one(index, source, arg=None) -> CompileResult:
+    """
+        Compile one Simple source; errors are returned, not raised.
+    """
+    parser = Parser(source, arg)
+    try:
+        stop = parser.parse()
+    except RuntimeError as e: # Syntax and semantic errors
+        return CompileResult(index, None, 0, parser.ctx.node_count() - 1, str(e))
+    except Exception as e:
+        return CompileResult(index, None, 0, parser.ctx.node_count() - 1, f"{type(e).__name__}: {e}")
+    return CompileResult(index, stop.print(), count_live(stop, parser.ctx.node_count()), parser.ctx.node_count() - 1,
+                         None)
+
+def count_live(stop, size=0):
+    """
+        Number of nodes reachable from stop by input edges.
+
+        @param size the node id counter of the graph's context, if known
+    """
+    return sum(1 for _ in Walker(size, inputs).walk(stop))
+
+def _compile_chunk(first, sources, arg):
+    return [compile_one(first + i, src, arg) for i, src in enumerate(sources)]
+
+def compile_stream(sources, workers=None, chunksize=16, arg=None):
+    """
+        Compile many sources on a pool of worker processes, yielding a
+        `CompileResult` for each as soon as its chunk finishes, in no
+        particular order; use `CompileResult.index` to match them up.
+
+        @param sources an iterable of Simple sources
+        @param workers number of processes, default `os.cpu_count()`;
+                       0 compiles in this process
+        @param chunksize number of sources sent to a worker at a time
+        @param arg the type of `arg`, shared by all sources
+    """
+    sources = list(sources)
+    chunks = [(i, sources[i:i + chunksize]) for i in range(0, len(sources), chunksize)]
+    if workers == 0:
+        for first, chunk in chunks:
+            yield from _compile_chunk(first, chunk, arg)
+        return
+    with ProcessPoolExecutor(workers or os.cpu_count()) as pool:
+        futures = [pool.submit(_compile_chunk, first, chunk, arg) for first, chunk in chunks]
+        for future in as_completed(futures):
+            yield from future.result()
+
+def compile_many(sources, workers=None, chunksize=16, arg=None):
+    """
+        Compile many sources on a pool of worker processes.
+
+        @return a list of `CompileResult`, in input order
+        @see compile_stream
+    """
+    sources = list(sources)
+    results = [None] * len(sources)
+    for r in compile_stream(sources, workers, chunksize, arg):
+        results[r.index] = r
+    return results
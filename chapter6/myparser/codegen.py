@@ -0,0 +1,225 @@
+from myparser.schedule import Schedule
+from myparser.node import StartNode, ReturnNode, ConstantNode, ProjNode, IfNode, RegionNode, PhiNode, \
+    AddNode, SubNode, MulNode, DivNode, MinusNode, NotNode, EQ, LT, LE
+from myparser.type import TypeInteger
+from myparser.utils import Walker
+
+class CodeGen():
+    """
+        Turns a parsed program into a Python function `f(arg) -> int`.
+
+        The control flow graph is walked from Start and emitted as nested
+        `if`/`else` blocks: an IfNode opens a block for each projection, which
+        runs to the RegionNode where the two sides merge, or to a `return`.
+        Entering a Region, each of its PhiNodes is assigned the input for
+        the edge taken, so after the merge the Phi is a plain variable.
+
+        Data nodes are emitted in the block that first needs them, in
+        schedule order, one assignment each; only the node a statement
+        needs is inlined into it, if it has a single use.  A node computed
+        inside a block is not visible after it, and is recomputed if needed
+        again.  The arithmetic matches the nodes' constant folding.
+
+            f = CodeGen(parser.parse()).function()
+            f(3)
+    """
+    _BINARY = {AddNode: "+", SubNode: "-", MulNode: "*", EQ: "==", LT: "<", LE: "<="}
+
+    def __init__(self, stop):
+        self.schedule = stop if isinstance(stop, Schedule) else Schedule(stop)
+        self._pos = {n._nid: i for i, n in enumerate(self.schedule.nodes)}
+        self._size = max(self._pos) + 1 # for Walkers
+        self._lines = None
+
+    def function(self, name="f"):
+        """
+            Compile the program into a Python function.
+        """
+        src = self.source(name)
+        ns = {}
+        exec(compile(src, f"<simple {name}>", "exec"), ns)
+        fn = ns[name]
+        fn.source = src
+        return fn
+
+    def source(self, name="f"):
+        """
+            The Python source of the function.
+        """
+        self._lines = [f"def {name}(arg):"]
+        self._indent = 1
+        self._defined = [set()]
+        start = self.schedule.nodes[0]
+        ctrl = next((p for p in start._outputs if self._live(p) and p.isCFG()), None)
+        if ctrl is None:
+            self._line("raise RuntimeError(\"No return reached\")")
+        else:
+            self._emit(ctrl, None)
+        return "\n".join(self._lines) + "\n"
+
+    # --------------------------------------
+    # Control
+
+    def _emit(self, c, until):
+        """
+            Emit the code following control node c, up to the RegionNode until
+            or a return.
+        """
+        while True:
+            s = self._succ(c)
+            if s is None:
+                self._line("raise RuntimeError(\"No return reached\")")
+                return
+            if isinstance(s, ReturnNode):
+                self._line(f"return {self._expr(s.expr())}")
+                return
+            if isinstance(s, RegionNode):
+                k = s._inputs.index(c)
+                for phi in self._phis(s):
+                    self._line(f"{self._var(phi)} = {self._expr(phi.In(k))}")
+                if s is until:
+                    return
+                for phi in self._phis(s):
+                    self._defined[-1].add(phi._nid)
+                c = s
+                continue
+            assert isinstance(s, IfNode)
+            merge = self._merge(s)
+            t, f = sorted((p for p in s._outputs if self._live(p)), key=lambda p: p._idx)
+            self._line(f"if {self._test(s.pred())}:")
+            self._block(t, merge or until)
+            self._line("else:")
+            self._block(f, merge or until)
+            if merge is None:
+                return
+            for phi in self._phis(merge):
+                self._defined[-1].add(phi._nid)
+            c = merge
+
+    def _block(self, c, until):
+        self._indent += 1
+        self._defined.append(set())
+        n = len(self._lines)
+        self._emit(c, until)
+        if len(self._lines) == n: # An arm with no Phi to assign
+            self._line("pass")
+        self._defined.pop()
+        self._indent -= 1
+
+    def _live(self, n):
+        return n._nid in self._pos
+
+    def _succ(self, c):
+        """
+            The control successor of c, `None` if it has none.
+        """
+        for o in c._outputs:
+            if o is not None and o.isCFG() and self._live(o):
+                return o
+        return None
+
+    def _phis(self, region):
+        return sorted((o for o in region._outputs if isinstance(o, PhiNode) and self._live(o)),
+                      key=lambda phi: self._pos[phi._nid])
+
+    def _merge(self, iff):
+        """
+            The RegionNode where the two sides of iff meet again, or `None` if
+            one side always returns.  It is the first, in schedule order, of
+            the Regions reachable from both sides.
+        """
+        t, f = (self._regions(p) for p in iff._outputs if self._live(p))
+        both = t & f
+        if not both:
+            return None
+        return self.schedule.nodes[min(self._pos[nid] for nid in both)]
+
+    def _regions(self, c):
+        walker = Walker(self._size, lambda n: [o for o in n._outputs if o is not None and o.isCFG() and self._live(o)])
+        return {n._nid for n in walker.walk(c) if isinstance(n, RegionNode)}
+
+    # --------------------------------------
+    # Data
+
+    def _line(self, s):
+        self._lines.append("    " * self._indent + s)
+
+    def _var(self, n):
+        return f"v{n._nid}"
+
+    def _uses(self, n):
+        return sum(1 for o in n._outputs if o is not None and self._live(o))
+
+    def _test(self, n):
+        # A comparison used only by the If needs no 0/1 value
+        if n.__class__ in (EQ, LT, LE) and self._uses(n) == 1:
+            return f"{self._expr(n.In(1))} {self._BINARY[n.__class__]} {self._expr(n.In(2))}"
+        if n.__class__ is NotNode and self._uses(n) == 1:
+            return f"not ({self._test(n.In(1))})"
+        return self._expr(n)
+
+    def _expr(self, n):
+        """
+            A Python expression for the value of data node n.  The nodes it
+            needs are assigned first, see `_assign`; n itself is inlined if
+            it has a single use.
+        """
+        e = self._leaf(n)
+        if e is not None:
+            return e
+        self._assign(n._inputs[1:])
+        e = self._compute(n)
+        if self._uses(n) == 1:
+            return e
+        self._line(f"{self._var(n)} = {e}")
+        self._defined[-1].add(n._nid)
+        return self._var(n)
+
+    def _leaf(self, n):
+        """
+            The expression of n if it needs no assignment: a constant, `arg`
+            or the variable of a node already assigned; else `None`.
+        """
+        if isinstance(n, ConstantNode):
+            if not isinstance(n._con, TypeInteger) or not n._con.is_constant():
+                raise RuntimeError(f"Cannot compile the constant {n._con}")
+            return repr(n._con.value())
+        if isinstance(n, ProjNode) and isinstance(n.ctrl(), StartNode):
+            return "arg"
+        if isinstance(n, PhiNode) or any(n._nid in d for d in self._defined):
+            return self._var(n)
+        return None
+
+    def _assign(self, roots):
+        """
+            Assign a variable to every node the roots need that has none
+            yet, one line each, in schedule order.  Expressions thus nest
+            at most a level deep, however long the program.
+        """
+        walker = Walker(self._size, lambda n: () if self._leaf(n) is not None else n._inputs[1:])
+        need = [n for root in roots for n in walker.walk(root) if self._leaf(n) is None]
+        for n in sorted(need, key=lambda n: self._pos[n._nid]):
+            self._line(f"{self._var(n)} = {self._compute(n)}")
+            self._defined[-1].add(n._nid)
+
+    def _compute(self, n):
+        cls = n.__class__
+        if cls in (AddNode, SubNode, MulNode):
+            return f"({self._expr(n.In(1))} {self._BINARY[cls]} {self._expr(n.In(2))})"
+        if cls in (EQ, LT, LE):
+            return f"(1 if {self._expr(n.In(1))} {self._BINARY[cls]} {self._expr(n.In(2))} else 0)"
+        if cls is DivNode:
+            lhs, rhs = self._expr(n.In(1)), self._expr(n.In(2))
+            if isinstance(n.In(2), ConstantNode):
+                return f"({lhs} // {rhs})" if n.In(2)._con.value() != 0 else "0"
+            if not rhs.isidentifier():
+                # Name the divisor, it is used twice
+                self._line(f"{self._var(n.In(2))} = {rhs}")
+                self._defined[-1].add(n.In(2)._nid)
+                rhs = self._var(n.In(2))
+            return f"({lhs} // {rhs} if {rhs} else 0)"
+        if cls is MinusNode:
+            return f"(-{self._expr(n.In(1))})"
+        if cls is NotNode:
+            return f"(0 if {self._expr(n.In(1))} else 1)"
+        raise RuntimeError(f"Cannot compile {n.label()}")
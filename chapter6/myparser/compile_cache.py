@@ -0,0 +1,217 @@
+import hashlib
+import io
+import os
+import threading
+from collections import OrderedDict
+from myparser.parser import Parser
+from myparser.compile_context import CompileContext
+from myparser.graph import Graph
+from myparser.graph_file import GraphFile
+from myparser.node import Node
+from myparser.iter_peeps import IterPeeps
+
+class CompileCache():
+    """
+        Caches parsed and optimized programs, so compiling the same source
+        twice skips lexing, parsing and peepholes.
+
+        Entries are keyed by a hash of the source text, the type of `arg`
+        and the optimizer settings, and hold the optimized graph in the
+        `GraphFile` format: plain data, checked when read, so a corrupt or
+        hostile entry is dropped as a miss.  The most recently used `max_entries` stay in
+        memory; with a directory, entries are also written there, one file
+        each, and the least recently used files are removed once they take
+        more than `max_bytes`.  The directory may be shared by processes;
+        each cache reads the sizes of the files in it once, when made, and
+        then keeps track of the files it writes and reads.
+
+        Every hit builds fresh nodes in a fresh CompileContext.  To change
+        the graph, use `compile`, which returns the context too, and enter
+        it first.  Errors are not cached.
+
+            cache = CompileCache(directory="/var/cache/simple")
+            stop = cache.parse("return arg+1;")
+            stop, ctx = cache.compile("return arg+1;")
+            with ctx:
+                IterPeeps.iterate(stop)
+    """
+    # Bump when the cached form changes, to miss on old entries
+    VERSION = 2
+
+    def __init__(self, max_entries=256, directory=None, max_bytes=64 << 20):
+        self.max_entries = max_entries
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._mem = OrderedDict()
+        self._disk = OrderedDict() # key -> size of its file, least recently used first
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+            for _, size, path in sorted(self._files()):
+                self._disk[os.path.basename(path)[:-len(".graph")]] = size
+                self._disk_bytes += size
+
+    @classmethod
+    def key(cls, source: str, arg=None) -> str:
+        settings = (cls.VERSION, repr(arg), Node.MAX_PEEPHOLE_DEPTH, IterPeeps.BUDGET)
+        h = hashlib.sha256(repr(settings).encode())
+        h.update(source.encode())
+        return h.hexdigest()
+
+    def parse(self, source: str, arg=None):
+        """
+            Like `Parser(source, arg).parse()`, from the cache if possible.
+
+            @return the StopNode
+        """
+        return self.compile(source, arg)[0]
+
+    def compile(self, source: str, arg=None):
+        """
+            Like `parse`, also returning the CompileContext of the nodes.
+
+            @return the StopNode and its CompileContext
+        """
+        key = self.key(source, arg)
+        data = self._get(key)
+        g = None if data is None else self._load(key, data)
+        if g is None:
+            g = Graph.build(Parser(source, arg).parse())
+            out = io.BytesIO()
+            GraphFile.write(g, out)
+            self._put(key, out.getvalue())
+        with CompileContext() as ctx:
+            nodes = g.materialize()
+        ctx.start, ctx.stop = nodes[g.start()], nodes[g.stop()]
+        if isinstance(g, GraphFile):
+            g.close()
+        return ctx.stop, ctx
+
+    def clear(self):
+        with self._lock:
+            self._mem.clear()
+            self._disk.clear()
+            self._disk_bytes = 0
+        if self.directory is not None:
+            for f in self._files():
+                _remove(f[2])
+
+    # --------------------------------------
+
+    def _get(self, key):
+        with self._lock:
+            data = self._mem.get(key)
+            if data is not None:
+                self._mem.move_to_end(key)
+                self.hits += 1
+                return data
+        if self.directory is not None:
+            path = self._path(key)
+            try:
+                with open(path, 'rb') as f:
+                    data = f.read()
+                os.utime(path) # Recently used
+            except OSError:
+                data = None
+            if data is not None:
+                with self._lock:
+                    self.disk_hits += 1
+                    self._remember(key, data)
+                    self._index(key, len(data))
+                return data
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def _load(self, key, data):
+        """
+            The graph of an entry, or `None` if the entry is malformed; it is
+            then dropped and counted as a miss.
+        """
+        try:
+            g = GraphFile(data)
+        except ValueError:
+            g = None
+        if g is not None:
+            try:
+                ok = g.check().start() >= 0 and g.stop() >= 0
+            except ValueError:
+                ok = False
+            if ok:
+                return g
+            g.close()
+        with self._lock:
+            self.misses += 1
+            self._mem.pop(key, None)
+            self._disk_bytes -= self._disk.pop(key, 0)
+        if self.directory is not None:
+            _remove(self._path(key))
+        return None
+
+    def _put(self, key, data):
+        with self._lock:
+            self._remember(key, data)
+        if self.directory is None:
+            return
+        path = self._path(key)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path) # Readers never see a partial file
+        with self._lock:
+            self._index(key, len(data))
+            evict = self._evict()
+        for path in evict:
+            _remove(path)
+
+    def _remember(self, key, data):
+        self._mem[key] = data
+        self._mem.move_to_end(key)
+        while len(self._mem) > self.max_entries:
+            self._mem.popitem(last=False)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ".graph")
+
+    def _index(self, key, size):
+        """
+            Note the file of key, just written or read, as most recently used.
+        """
+        self._disk_bytes += size - self._disk.pop(key, 0)
+        self._disk[key] = size
+
+    def _files(self):
+        files = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".graph"): continue
+            path = os.path.join(self.directory, name)
+            try:
+                st = os.stat(path)
+            except OSError: # Removed by another process
+                continue
+            files.append((st.st_mtime, st.st_size, path))
+        return files
+
+    def _evict(self):
+        """
+            Drop the least recently used files from the index until it fits
+            in max_bytes.
+
+            @return the paths of the files to remove
+        """
+        paths = []
+        while self._disk_bytes > self.max_bytes:
+            key, size = self._disk.popitem(last=False)
+            self._disk_bytes -= size
+            paths.append(self._path(key))
+        return paths
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
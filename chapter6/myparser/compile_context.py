@@ -0,0 +1,67 @@
+import contextvars
+
+class CompileContext():
+    """
+        All the mutable state of one compilation: the node id counter, the
+        START and STOP nodes, the peephole switches, the GVN table, the
+        IterPeeps worklist and the optional `PeepStats`.
+
+        Nodes find the context through `CompileContext.current()`, which is
+        the context most recently entered with `with ctx:` in the running
+        thread or asyncio task.  The Parser enters its own context while it
+        builds nodes, so any number of parsers can run side by side, on a
+        thread pool or interleaved in one thread.
+
+        Code that builds or rewrites nodes outside of `Parser.parse` must
+        enter the parser's context first:
+
+            with parser.ctx:
+                IterPeeps.add_all(stop)
+                IterPeeps.iterate(stop)
+    """
+    _current = contextvars.ContextVar("CompileContext")
+
+    def __init__(self):
+        from myparser.iter_peeps import IterPeeps
+        self._unique_id = 1
+        self.start = None
+        self.stop = None
+        self.disable_peephole = False # allow disabling peephole so that we can observe the full graph.
+        self.peephole_depth = 0
+        self.gvn = {}                 # Global Value Numbering table, see `Node.gvn_key`
+        self.work = IterPeeps.WorkList()
+        self.stats = None             # a PeepStats to count the peephole rules, or None
+        self._tokens = []
+
+    def next_id(self):
+        nid = self._unique_id
+        self._unique_id += 1
+        return nid
+
+    def node_count(self):
+        """
+            Number of node ids handed out so far; every node id is below this.
+        """
+        return self._unique_id
+
+    def __enter__(self):
+        self._tokens.append(CompileContext._current.set(self))
+        return self
+
+    def __exit__(self, *exc):
+        CompileContext._current.reset(self._tokens.pop())
+        return False
+
+    @classmethod
+    def active(cls):
+        """
+            The current context, or `None` outside of any.
+        """
+        return cls._current.get(None)
+
+    @classmethod
+    def current(cls):
+        ctx = cls._current.get(None)
+        if ctx is None:
+            raise RuntimeError("No active CompileContext; use 'with parser.ctx:'")
+        return ctx
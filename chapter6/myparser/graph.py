@@ -0,0 +1,258 @@
+from array import array
+from myparser.compile_context import CompileContext
+from myparser.utils import Walker
+from myparser.node import Node, StartNode, StopNode, ReturnNode, ConstantNode, ProjNode, IfNode, RegionNode, \
+    PhiNode, AddNode, SubNode, MulNode, DivNode, MinusNode, NotNode, EQ, LT, LE, ScopeNode
+
+class Graph():
+    """
+        A struct-of-arrays arena holding a Sea of Nodes graph.
+
+        Each node is a row; per-row data lives in flat `array('i')` columns and
+        the def-use edges in CSR form: the inputs of row `r` are
+        `ins[in_start[r]:in_start[r+1]]`, in order, with -1 for a `None` input.
+        Outputs are stored the same way.  Rows are dense and sorted by node id;
+        `nid[r]` is the `_nid` of row `r`.
+
+        Types and strings are interned in the `types` and `strs` tables and
+        referred to by index.  The per-row `payload` is the type index of a
+        ConstantNode's constant or a StartNode's arguments, or a ProjNode's
+        index; `label` is the string index of a ProjNode or PhiNode label.
+
+        Whole-graph passes such as reachability or dead-node sweeps are plain
+        scans over integer columns instead of pointer chasing, the arena pickles
+        trivially, and the columns support the buffer protocol, so e.g.
+        `numpy.frombuffer(g.ins, dtype=numpy.int32)` is a zero-copy view.
+
+        Build one from a live graph with `Graph.build`; turn it back into nodes
+        with `materialize`.  ScopeNodes are parser helpers and are left out.
+    """
+    # Node kinds, by index
+    KINDS = [StartNode, StopNode, ReturnNode, ConstantNode, ProjNode, IfNode, RegionNode, PhiNode,
+             AddNode, SubNode, MulNode, DivNode, MinusNode, NotNode, EQ, LT, LE]
+    KIND_IDS = {cls: i for i, cls in enumerate(KINDS)}
+
+    def __init__(self):
+        self.nid = array('i')
+        self.kind = array('b')
+        self.type = array('i')      # index into `types`, -1 if untyped
+        self.payload = array('i')
+        self.label = array('i')     # index into `strs`, -1 if none
+        self.in_start = array('i', [0])
+        self.ins = array('i')
+        self.out_start = array('i', [0])
+        self.outs = array('i')
+        self.types = []
+        self.strs = []
+
+    def __len__(self):
+        return len(self.kind)
+
+    @classmethod
+    def build(cls, root):
+        """
+            Pack every node connected to root, following both input and output
+            edges, into a new Graph.
+        """
+        ctx = CompileContext.active()
+        walker = Walker(ctx.node_count() if ctx is not None else root._nid + 1, _edges)
+        nodes = {n._nid: n for n in walker.walk(root)}
+        order = sorted(nodes)
+        row = {nid: r for r, nid in enumerate(order)}
+
+        g = cls()
+        type_ids = {}
+        str_ids = {}
+        def tid(t):
+            if t is None: return -1
+            i = type_ids.get(id(t))
+            if i is None:
+                i = type_ids[id(t)] = len(g.types)
+                g.types.append(t)
+            return i
+        def sid(s):
+            i = str_ids.get(s)
+            if i is None:
+                i = str_ids[s] = len(g.strs)
+                g.strs.append(s)
+            return i
+
+        for nid in order:
+            n = nodes[nid]
+            g.nid.append(nid)
+            g.kind.append(cls.KIND_IDS[n.__class__])
+            g.type.append(tid(n._type))
+            if isinstance(n, ConstantNode): payload = tid(n._con)
+            elif isinstance(n, StartNode): payload = tid(n._args)
+            elif isinstance(n, ProjNode): payload = n._idx
+            else: payload = -1
+            g.payload.append(payload)
+            g.label.append(sid(n._label) if isinstance(n, (ProjNode, PhiNode)) else -1)
+            g.ins.extend(-1 if m is None else row[m._nid] for m in n._inputs)
+            g.in_start.append(len(g.ins))
+            g.outs.extend(-1 if m is None else row[m._nid] for m in n._outputs if not isinstance(m, ScopeNode))
+            g.out_start.append(len(g.outs))
+        return g
+
+    # --------------------------------------
+    # Row accessors
+
+    def row(self, nid):
+        """
+            The row of the node with id nid, or -1.
+        """
+        lo, hi = 0, len(self.nid)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.nid[mid] < nid: lo = mid + 1
+            else: hi = mid
+        return lo if lo < len(self.nid) and self.nid[lo] == nid else -1
+
+    def inputs(self, r):
+        return self.ins[self.in_start[r]:self.in_start[r + 1]]
+
+    def outputs(self, r):
+        return self.outs[self.out_start[r]:self.out_start[r + 1]]
+
+    def kind_of(self, r):
+        return Graph.KINDS[self.kind[r]]
+
+    def rows_of(self, cls):
+        """
+            All rows of the given node class.
+        """
+        k = Graph.KIND_IDS[cls]
+        return [r for r, kr in enumerate(self.kind) if kr == k]
+
+    def stop(self):
+        rows = self.rows_of(StopNode)
+        return rows[0] if rows else -1
+
+    def start(self):
+        rows = self.rows_of(StartNode)
+        return rows[0] if rows else -1
+
+    # --------------------------------------
+    # Whole-graph passes
+
+    def reachable(self, r=None):
+        """
+            Mark the rows reachable from row r (default: the StopNode) by
+            input edges.
+
+            @return a bytearray with a 1 for every reachable row
+        """
+        if r is None: r = self.stop()
+        seen = bytearray(len(self))
+        seen[r] = 1
+        stack = [r]
+        ins, in_start = self.ins, self.in_start
+        while stack:
+            x = stack.pop()
+            for m in ins[in_start[x]:in_start[x + 1]]:
+                if m >= 0 and not seen[m]:
+                    seen[m] = 1
+                    stack.append(m)
+        return seen
+
+    def sweep(self, r=None):
+        """
+            Remove every row not reachable from row r (default: the StopNode),
+            along with the edges to them.
+
+            @return a new, compacted Graph
+        """
+        keep = self.reachable(r)
+        remap = array('i', [-1]) * len(self)
+        n = 0
+        for x in range(len(self)):
+            if keep[x]:
+                remap[x] = n
+                n += 1
+        g = Graph()
+        g.types = self.types
+        g.strs = self.strs
+        for x in range(len(self)):
+            if not keep[x]: continue
+            g.nid.append(self.nid[x])
+            g.kind.append(self.kind[x])
+            g.type.append(self.type[x])
+            g.payload.append(self.payload[x])
+            g.label.append(self.label[x])
+            g.ins.extend(-1 if m < 0 else remap[m] for m in self.inputs(x))
+            g.in_start.append(len(g.ins))
+            g.outs.extend(-1 if m < 0 else remap[m] for m in self.outputs(x) if m < 0 or keep[m])
+            g.out_start.append(len(g.outs))
+        return g
+
+    def is_cfg(self, r):
+        cls = self.kind_of(r)
+        if cls is ProjNode:
+            return self.payload[r] == 0 or self.kind_of(self.ins[self.in_start[r]]) is IfNode
+        return cls in (StartNode, StopNode, ReturnNode, IfNode, RegionNode)
+
+    def glabel(self, r):
+        cls = self.kind_of(r)
+        if cls is ConstantNode: return f"#{self.types[self.payload[r]]}"
+        if cls is ProjNode: return self.strs[self.label[r]]
+        if cls is PhiNode: return "&phi;_" + self.strs[self.label[r]]
+        return _GLABELS[cls]
+
+    def write_dot(self, out, name="graph"):
+        """
+            Write the graph in GraphViz dot format to a file-like object.
+            A plain rendering: one dot node per row and one edge per input.
+        """
+        out.write(f"digraph {name} {{\n\trankdir=BT;\n\tordering=\"in\";\n")
+        for r in range(len(self)):
+            shape = " shape=box style=filled fillcolor=yellow" if self.is_cfg(r) else ""
+            out.write(f"\tn{self.nid[r]} [label=\"{self.glabel(r)}\"{shape}];\n")
+        con = Graph.KIND_IDS[ConstantNode]
+        for r in range(len(self)):
+            if self.kind[r] == con: continue # Do not display the Constant->Start edge
+            for i, m in enumerate(self.inputs(r)):
+                if m >= 0:
+                    out.write(f"\tn{self.nid[r]} -> n{self.nid[m]} [taillabel={i}];\n")
+        out.write("}\n")
+
+    # --------------------------------------
+    # Back to nodes
+
+    def materialize(self):
+        """
+            Build live nodes from the arena, keeping their node ids.  No
+            CompileContext is needed, but to go on optimizing the nodes enter
+            one that has their START.
+
+            @return the list of nodes, indexed by row
+        """
+        nodes = []
+        for r in range(len(self)):
+            cls = self.kind_of(r)
+            n = cls.__new__(cls)
+            n._nid = self.nid[r]
+            n._type = None if self.type[r] < 0 else self.types[self.type[r]]
+            n._out_pos = None
+            n._gvn_key = None
+            if cls is ConstantNode: n._con = self.types[self.payload[r]]
+            elif cls is StartNode: n._args = self.types[self.payload[r]]
+            elif cls is ProjNode: n._idx = self.payload[r]
+            if self.label[r] >= 0: n._label = self.strs[self.label[r]]
+            nodes.append(n)
+        for r, n in enumerate(nodes):
+            n._inputs = [None if m < 0 else nodes[m] for m in self.inputs(r)]
+            n._outputs = []
+            for m in self.outputs(r):
+                n.add_use(None if m < 0 else nodes[m])
+        # New nodes made in the active context must not reuse these ids
+        ctx = CompileContext.active()
+        if ctx is not None and len(nodes):
+            ctx._unique_id = max(ctx._unique_id, self.nid[-1] + 1)
+        return nodes
+
+def _edges(n):
+    # ScopeNodes are parser helpers, left out of the arena
+    return n._inputs + [m for m in n._outputs if not isinstance(m, ScopeNode)]
+
+# Labels of the node kinds that carry no label payload
+_GLABELS = {cls: cls.GLABEL for cls in Graph.KINDS if cls not in (ConstantNode, ProjNode, PhiNode)}
@@ -0,0 +1,312 @@
+import mmap
+import struct
+import sys
+from array import array
+from myparser.graph import Graph
+from myparser.node import ConstantNode, StartNode
+from myparser.type import TypeInteger, TypeTuple, IF
+from myparser.type.type import BOTTOM, TOP, CONTROL
+from myparser.type.type_integer import TOP as INT_TOP, BOT as INT_BOT
+
+class GraphFile(Graph):
+    """
+        A `Graph` arena stored in a compact binary file, read through `mmap`.
+
+        The file is the arena's columns laid end to end, so opening one
+        reads nothing but the header: the integer columns are memoryviews
+        straight into the mapping, and a type or label is decoded the first
+        time it is asked for.  Graph's whole-graph passes run directly on
+        the mapped columns.  `materialize` builds every node at once; only
+        the types and labels are lazy.
+
+        Opening checks the header and that the sections fit the file, and
+        raises ValueError if not; `check` goes on to check the contents, for
+        a file that may be corrupt or hostile.  A GraphFile may also be made
+        from bytes of the same layout.
+
+        Layout, little-endian and 4-byte aligned:
+
+            header   magic "SoN\\0", version, then the row, input, type and
+                     string counts and a reserved 0 (6 x u32)
+            nid      i32 x rows
+            type     i32 x rows, index into the type table, -1 if untyped
+            payload  i32 x rows
+            label    i32 x rows, index into the string table, -1 if none
+            kind     i8 x rows, padded to 4 bytes; see `Graph.KINDS`
+            in_start i32 x (rows + 1)
+            ins      i32 x inputs, the inputs of every row in order, -1 for None
+            types    i32 x (types + 1) offsets, then the records, padded
+            strs     i32 x (strs + 1) offsets, then UTF-8 text
+
+        A type record is a tag byte; an integer constant is followed by its
+        value in two's complement, a tuple by the u32 indices of its
+        element types, which come earlier in the table.
+
+        Outputs are not stored; they are rebuilt from the inputs, in row
+        order, when first needed.
+
+            with open("prog.son", "wb") as f:
+                GraphFile.write(Graph.build(stop), f)
+            with GraphFile("prog.son") as g:
+                stop = g.materialize()[g.stop()]
+    """
+    MAGIC = b"SoN\0"
+    VERSION = 1
+    _HEADER = struct.Struct("<4s6I")
+    # Type record tags
+    _T_BOTTOM, _T_TOP, _T_CONTROL, _T_INT_TOP, _T_INT_BOT, _T_INT, _T_TUPLE, _T_IF = range(8)
+
+    def __init__(self, path):
+        """
+            @param path the file to map, or the bytes of one
+        """
+        # No super().__init__(): every column comes from the file
+        if isinstance(path, (bytes, bytearray, memoryview)):
+            self._file = self._map = None
+            self._buf = memoryview(path)
+            path = "<bytes>"
+        else:
+            self._file = open(path, 'rb')
+            try:
+                self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError: # Empty file
+                self._file.close()
+                raise ValueError(f"Not a version {self.VERSION} graph file: {path}")
+            self._buf = memoryview(self._map)
+        try:
+            self._open(path)
+            return
+        except ValueError as e:
+            error = str(e)
+        # Out of the except block, so the traceback no longer holds views of the map
+        self.close()
+        raise ValueError(error)
+
+    def _open(self, path):
+        buf = self._buf
+        if len(buf) < self._HEADER.size:
+            raise ValueError(f"Not a version {self.VERSION} graph file: {path}")
+        magic, version, rows, nins, ntypes, nstrs, _ = self._HEADER.unpack_from(buf)
+        if magic != self.MAGIC or version != self.VERSION:
+            raise ValueError(f"Not a version {self.VERSION} graph file: {path}")
+        pos = self._HEADER.size
+        def take(size):
+            nonlocal pos
+            end = pos + _pad(size)
+            if size < 0 or end > len(buf):
+                raise ValueError(f"Truncated graph file: {path}")
+            section = buf[pos:pos + size]
+            pos = end
+            return section
+        self.nid = _cast(take(4 * rows))
+        self.type = _cast(take(4 * rows))
+        self.payload = _cast(take(4 * rows))
+        self.label = _cast(take(4 * rows))
+        self.kind = take(rows).cast('b')
+        self.in_start = _cast(take(4 * (rows + 1)))
+        self.ins = _cast(take(4 * nins))
+        type_off = _cast(take(4 * (ntypes + 1)))
+        self.types = _Table(take(type_off[-1]), type_off, self._type)
+        str_off = _cast(take(4 * (nstrs + 1)))
+        self.strs = _Table(take(str_off[-1]), str_off, lambda b: str(b, "utf-8"))
+        if pos != len(buf):
+            raise ValueError(f"Trailing data in graph file: {path}")
+        self.out_start = None
+        self.outs = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def close(self):
+        """
+            Unmap the file.  Nodes already materialized stay valid.
+        """
+        for col in ("nid", "type", "payload", "label", "kind", "in_start", "ins"):
+            if isinstance(getattr(self, col, None), memoryview):
+                getattr(self, col).release()
+        if hasattr(self, "types"):
+            self.types._release()
+        if hasattr(self, "strs"):
+            self.strs._release()
+        self._buf.release()
+        if self._map is not None:
+            self._map.close()
+            self._file.close()
+
+    def check(self):
+        """
+            Check that the columns and tables make a well formed graph, so
+            that `materialize` builds only nodes of known kinds, with inputs,
+            types and labels in range.  Decodes every type and label.
+
+            @return self
+            @raise ValueError if not
+        """
+        rows, ntypes, nstrs = len(self), len(self.types), len(self.strs)
+        def require(ok, what):
+            if not ok: raise ValueError(f"Bad graph file: {what}")
+        require(all(0 <= k < len(Graph.KINDS) for k in self.kind), "node kind")
+        require(all(0 < self.nid[r] < self.nid[r + 1] for r in range(rows - 1)) and (not rows or self.nid[0] > 0),
+                "node ids")
+        starts = self.in_start
+        require(starts[0] == 0 and starts[rows] == len(self.ins) and all(starts[r] <= starts[r + 1] for r in range(rows)),
+                "input offsets")
+        require(all(-1 <= m < rows for m in self.ins), "inputs")
+        require(all(-1 <= t < ntypes for t in self.type), "types")
+        require(all(-1 <= l < nstrs for l in self.label), "labels")
+        con, start = Graph.KIND_IDS[ConstantNode], Graph.KIND_IDS[StartNode]
+        require(all(0 <= p < ntypes for k, p in zip(self.kind, self.payload) if k in (con, start)), "payloads")
+        for table in (self.types, self.strs):
+            off = table._off
+            require(off[0] == 0 and all(off[i] <= off[i + 1] for i in range(len(table))), "table offsets")
+        for i in range(ntypes):
+            rec = self.types._blob[self.types._off[i]:self.types._off[i + 1]]
+            require(len(rec) and rec[0] <= self._T_IF, "type record")
+            if rec[0] == self._T_TUPLE:
+                # Elements come earlier in the table
+                require(all(0 <= e < i for e in _cast(rec[1:])), "tuple type")
+            self.types[i]
+        for i in range(nstrs):
+            self.strs[i]
+        return self
+
+    def outputs(self, r):
+        if self.outs is None:
+            self._reverse()
+        return super().outputs(r)
+
+    def _reverse(self):
+        cnt = array('i', [0]) * (len(self) + 1)
+        for m in self.ins:
+            if m >= 0: cnt[m + 1] += 1
+        for r in range(len(self)):
+            cnt[r + 1] += cnt[r]
+        outs = array('i', [0]) * len(self.ins)
+        fill = array('i', cnt)
+        for r in range(len(self)):
+            for m in self.inputs(r):
+                if m >= 0:
+                    outs[fill[m]] = r
+                    fill[m] += 1
+        self.out_start = cnt
+        self.outs = outs[:cnt[-1]]
+
+    def _type(self, rec):
+        tag = rec[0]
+        if tag == self._T_INT: return TypeInteger.constant(int.from_bytes(rec[1:], "little", signed=True))
+        if tag == self._T_TUPLE: return TypeTuple([self.types[i] for i in _cast(rec[1:])])
+        return (BOTTOM, TOP, CONTROL, INT_TOP, INT_BOT, None, None, IF)[tag]
+
+    # --------------------------------------
+    # Writing
+
+    @classmethod
+    def write(cls, g: Graph, out):
+        """
+            Write the Graph g to the binary file object out.
+        """
+        # Tuples refer to their element types, which go first
+        types = []
+        tids = {}
+        def add(t):
+            if id(t) in tids: return tids[id(t)]
+            if isinstance(t, TypeTuple) and t is not IF:
+                elems = [add(e) for e in t._types]
+                rec = bytes([cls._T_TUPLE]) + _le(array('i', elems)).tobytes()
+            else:
+                rec = cls._type_record(t)
+            tids[id(t)] = len(types)
+            types.append(rec)
+            return tids[id(t)]
+        remap = [add(t) for t in g.types]
+        strs = [s.encode("utf-8") for s in g.strs]
+
+        rows = len(g)
+        out.write(cls._HEADER.pack(cls.MAGIC, cls.VERSION, rows, len(g.ins), len(types), len(strs), 0))
+        _ints(out, g.nid)
+        _ints(out, [-1 if t < 0 else remap[t] for t in g.type])
+        # ConstantNode and StartNode payloads are type indices too
+        con, start = Graph.KIND_IDS[ConstantNode], Graph.KIND_IDS[StartNode]
+        _ints(out, [remap[p] if k in (con, start) else p for k, p in zip(g.kind, g.payload)])
+        _ints(out, g.label)
+        out.write(bytes(array('b', g.kind)))
+        out.write(bytes(_pad(rows) - rows))
+        _ints(out, g.in_start)
+        _ints(out, g.ins)
+        _blobs(out, types)
+        _blobs(out, strs)
+
+    @classmethod
+    def _type_record(cls, t):
+        if t is IF: return bytes([cls._T_IF])
+        if isinstance(t, TypeInteger):
+            if t.is_constant():
+                v = t.value()
+                return bytes([cls._T_INT]) + v.to_bytes((v.bit_length() + 8) // 8, "little", signed=True)
+            return bytes([cls._T_INT_TOP if t.is_top() else cls._T_INT_BOT])
+        tag = {id(BOTTOM): cls._T_BOTTOM, id(TOP): cls._T_TOP, id(CONTROL): cls._T_CONTROL}.get(id(t))
+        if tag is None:
+            raise ValueError(f"Cannot write the type {t}")
+        return bytes([tag])
+
+class _Table():
+    """
+        A table of variable length records in the mapped file, decoded and
+        kept on first access.
+    """
+    def __init__(self, blob, off, decode):
+        self._blob = blob
+        self._off = off
+        self._decode = decode
+        self._cache = [None] * (len(off) - 1)
+
+    def __len__(self):
+        return len(self._cache)
+
+    def __getitem__(self, i):
+        x = self._cache[i]
+        if x is None:
+            x = self._cache[i] = self._decode(self._blob[self._off[i]:self._off[i + 1]])
+        return x
+
+    def _release(self):
+        self._blob.release()
+        if isinstance(self._off, memoryview):
+            self._off.release()
+
+def _pad(n):
+    return (n + 3) & ~3
+
+def _cast(b):
+    """
+        The little-endian i32 column in b: a view where the host is
+        little-endian, else a swapped copy.
+    """
+    if len(b) % 4:
+        raise ValueError("Misaligned graph file")
+    if sys.byteorder == "little":
+        return b.cast('i')
+    col = array('i', bytes(b))
+    col.byteswap()
+    return col
+
+def _le(col):
+    if sys.byteorder != "little":
+        col.byteswap()
+    return col
+
+def _ints(out, col):
+    out.write(_le(array('i', col)).tobytes())
+
+def _blobs(out, recs):
+    off = array('i', [0])
+    for rec in recs:
+        off.append(off[-1] + len(rec))
+    out.write(_le(off).tobytes())
+    data = b"".join(recs)
+    out.write(data)
+    out.write(bytes(_pad(len(data)) - len(data)))
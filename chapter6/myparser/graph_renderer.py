@@ -0,0 +1,184 @@
+import atexit
+import itertools
+import os
+import subprocess
+import tempfile
+import threading
+from collections import deque
+
+class GraphRenderer():
+    """
+        Renders dot snapshots of the graph in the background, so the parser
+        never waits on Graphviz.
+
+        `submit` writes each snapshot to its own file, `<prefix>-<pid>-<seq>.dot`
+        in `directory`, and returns; a small pool of worker threads runs `dot`
+        on it.  The directory defaults to `simple-graphs` in the temp
+        directory, not the current one.  Only the files of the last `keep`
+        rendered snapshots are kept; older ones are removed.
+
+        At most `max_pending` snapshots wait for a worker.  When that many
+        are waiting the policy decides:
+        - "coalesce": the oldest waiting snapshot is dropped, as a newer one
+          supersedes it;
+        - "drop": the new snapshot is dropped, before it is written.
+        The files of a dropped snapshot are removed.
+
+        A missing or failing `dot` is counted in `failed`, not raised.
+    """
+    # Command run on each snapshot; {dot} and {out} are the input and output paths
+    COMMAND = ["dot", "-T{fmt}", "{dot}", "-o", "{out}"]
+    _shared = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self, directory=None, prefix="graph", fmt="png", workers=1, max_pending=8, policy="coalesce",
+                 keep=16):
+        if policy not in ("coalesce", "drop"):
+            raise ValueError(f"Unknown policy {policy!r}")
+        self.directory = directory or os.path.join(tempfile.gettempdir(), "simple-graphs")
+        self.prefix = prefix
+        self.fmt = fmt
+        self.max_pending = max_pending
+        self.policy = policy
+        self.keep = keep
+        self.submitted = 0
+        self.rendered = 0
+        self.dropped = 0
+        self.failed = 0
+        self._seq = itertools.count()
+        self._pending = deque()
+        self._kept = deque() # rendered snapshots whose files remain, oldest first
+        self._busy = 0
+        self._closed = False
+        self._cv = threading.Condition()
+        self._workers = [threading.Thread(target=self._work, name=f"GraphRenderer-{i}", daemon=True)
+                         for i in range(workers)]
+        for t in self._workers:
+            t.start()
+
+    @classmethod
+    def shared(cls):
+        """
+            The renderer used by `Parser.showGraph`, made on first use.  It
+            finishes its queued snapshots at exit.
+        """
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls()
+                atexit.register(cls._shared.close)
+            return cls._shared
+
+    @classmethod
+    def set_shared(cls, renderer):
+        """
+            Make renderer the one `Parser.showGraph` uses; the caller closes
+            it.
+
+            @return the previous shared renderer, or `None`
+        """
+        with cls._shared_lock:
+            old, cls._shared = cls._shared, renderer
+            return old
+
+    def submit(self, dot):
+        """
+            Write a dot snapshot and queue it for rendering; never waits on
+            a worker.
+
+            @param dot the dot text, or a function writing it to the file
+            it is given, so a large graph streams to disk
+            @return the path the image will be written to, or `None` if the
+                    snapshot was dropped
+        """
+        with self._cv:
+            if self._closed:
+                raise RuntimeError("GraphRenderer is closed")
+            self.submitted += 1
+            if self.policy == "drop" and len(self._pending) >= self.max_pending:
+                self.dropped += 1
+                return None
+        base = os.path.join(self.directory, f"{self.prefix}-{os.getpid()}-{next(self._seq):04d}")
+        os.makedirs(self.directory, exist_ok=True)
+        with open(base + ".dot", 'w') as f:
+            if callable(dot): dot(f)
+            else: f.write(dot)
+        old = None
+        with self._cv:
+            if len(self._pending) >= self.max_pending:
+                # Filled up while writing under "drop"
+                self.dropped += 1
+                old = self._pending.popleft() if self.policy == "coalesce" else base
+            if old is not base:
+                self._pending.append(base)
+                self._cv.notify()
+        if old is not None:
+            self._remove(old)
+        return None if old is base else f"{base}.{self.fmt}"
+
+    def flush(self, timeout=None):
+        """
+            Wait until every queued snapshot is rendered.
+
+            @return `False` if the timeout ran out first
+        """
+        with self._cv:
+            return self._cv.wait_for(lambda: not self._pending and not self._busy, timeout)
+
+    def close(self, wait=True):
+        """
+            Stop the workers, after rendering the queued snapshots if wait,
+            else dropping them.
+        """
+        dropped = ()
+        with self._cv:
+            self._closed = True
+            if not wait:
+                self.dropped += len(self._pending)
+                dropped = list(self._pending)
+                self._pending.clear()
+            self._cv.notify_all()
+        for base in dropped:
+            self._remove(base)
+        for t in self._workers:
+            t.join()
+
+    def _work(self):
+        while True:
+            with self._cv:
+                self._cv.wait_for(lambda: self._pending or self._closed)
+                if not self._pending:
+                    return
+                base = self._pending.popleft()
+                self._busy += 1
+            try:
+                ok = self.render(base + ".dot", f"{base}.{self.fmt}")
+            except Exception:
+                ok = False
+            with self._cv:
+                self._busy -= 1
+                if ok: self.rendered += 1
+                else: self.failed += 1
+                self._kept.append(base)
+                old = self._kept.popleft() if len(self._kept) > self.keep else None
+                self._cv.notify_all()
+            if old is not None:
+                self._remove(old)
+
+    def render(self, dot_path, out_path):
+        """
+            Run the render command on one snapshot; runs on a worker thread.
+
+            @return `True` on success
+        """
+        cmd = [arg.format(fmt=self.fmt, dot=dot_path, out=out_path) for arg in self.COMMAND]
+        try:
+            return subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL).returncode == 0
+        except OSError: # No Graphviz
+            return False
+
+    def _remove(self, base):
+        for path in (base + ".dot", f"{base}.{self.fmt}"):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
@@ -0,0 +1,94 @@
+from myparser.schedule import Schedule
+from myparser.node import StartNode, StopNode, ReturnNode, ConstantNode, ProjNode, IfNode, RegionNode, PhiNode, \
+    AddNode, SubNode, MulNode, DivNode, MinusNode, NotNode, EQ, LT, LE
+from myparser.type import TypeInteger
+
+# Opcodes
+CON, ARG, LIVE, ADD, SUB, MUL, DIV, MINUS, NOT, EQL, LTH, LEQ, IF, IFT, IFF, REGION, PHI, RETURN, NOP = range(19)
+_BINARY = {AddNode: ADD, SubNode: SUB, MulNode: MUL, DivNode: DIV, EQ: EQL, LT: LTH, LE: LEQ}
+
+class Interpreter():
+    """
+        Runs a parsed program for a given `arg`, by walking its `Schedule`.
+
+        Every node gets a value, in schedule order:
+        - data nodes their integer value;
+        - control nodes whether control reaches them: an IfNode the outcome
+          of its test, `None` if not reached, and a RegionNode the index of
+          the input control came in by, 0 if none;
+        - a PhiNode the value of its input matching its Region's.
+        A missing input is slot -1; as a control input it is never reached.
+        The result is the value of the first ReturnNode reached.
+
+        The arithmetic matches the constant folding of the nodes, so running
+        a program gives the same result as parsing it with a constant `arg`.
+
+            run = Interpreter(parser.parse())
+            run(3), run(4)
+    """
+    def __init__(self, stop):
+        sched = stop if isinstance(stop, Schedule) else Schedule(stop)
+        self.schedule = sched
+        self._code = [self._op(n, ins) for n, ins in zip(sched.nodes, sched.ins)]
+        self._returns = [(r, sched.ins[r][1]) for r in sched.returns]
+
+    @staticmethod
+    def _op(n, ins):
+        cls = n.__class__
+        if cls in _BINARY: return (_BINARY[cls], ins[1], ins[2])
+        if cls is ConstantNode:
+            if not isinstance(n._con, TypeInteger) or not n._con.is_constant():
+                raise RuntimeError(f"Cannot run the constant {n._con}")
+            return (CON, n._con.value(), None)
+        if cls is ProjNode:
+            if isinstance(n.ctrl(), StartNode): return (LIVE, None, None) if n._idx == 0 else (ARG, None, None)
+            return (IFT if n._idx == 0 else IFF, ins[0], None)
+        if cls is PhiNode: return (PHI, ins[0], ins)
+        if cls is RegionNode: return (REGION, ins, None)
+        if cls is IfNode: return (IF, ins[0], ins[1])
+        if cls is MinusNode: return (MINUS, ins[1], None)
+        if cls is NotNode: return (NOT, ins[1], None)
+        if cls is ReturnNode: return (RETURN, ins[0], None)
+        if cls is StartNode: return (LIVE, None, None)
+        if cls is StopNode: return (NOP, None, None)
+        raise RuntimeError(f"Cannot run {n.label()}")
+
+    def __call__(self, arg: int) -> int:
+        return self.run(arg)
+
+    def run(self, arg: int) -> int:
+        vals = [None] * len(self._code)
+        i = 0
+        for op, a, b in self._code:
+            if op == ADD: v = vals[a] + vals[b]
+            elif op == MUL: v = vals[a] * vals[b]
+            elif op == CON: v = a
+            elif op == SUB: v = vals[a] - vals[b]
+            elif op == ARG: v = arg
+            elif op == PHI:
+                r = vals[a]
+                v = vals[b[r]] if r else 0
+            elif op == EQL: v = 1 if vals[a] == vals[b] else 0
+            elif op == LTH: v = 1 if vals[a] < vals[b] else 0
+            elif op == LEQ: v = 1 if vals[a] <= vals[b] else 0
+            elif op == DIV: v = vals[a] // vals[b] if vals[b] != 0 else 0
+            elif op == MINUS: v = -vals[a]
+            elif op == NOT: v = 1 if vals[a] == 0 else 0
+            elif op == IF: v = (vals[b] != 0) if a >= 0 and vals[a] else None
+            elif op == IFT: v = vals[a] is True
+            elif op == IFF: v = vals[a] is False
+            elif op == REGION:
+                v = 0
+                for k in range(1, len(a)):
+                    if a[k] >= 0 and vals[a[k]]:
+                        v = k
+                        break
+            elif op == RETURN: v = a >= 0 and bool(vals[a])
+            elif op == LIVE: v = True
+            else: v = None
+            vals[i] = v
+            i += 1
+        for r, e in self._returns:
+            if vals[r]:
+                return vals[e]
+        raise RuntimeError("No return reached")
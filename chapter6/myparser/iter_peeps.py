@@ -0,0 +1,115 @@
+from collections import deque
+from myparser.compile_context import CompileContext
+from myparser.utils import Walker, inputs
+
+class IterPeeps():
+    """
+        The IterPeeps runs after parsing. It iterates the peepholes to a fixed point.
+
+        The IterPeeps also picks up work deferred during parsing: `peephole` only
+        nests so deep (see `Node.MAX_PEEPHOLE_DEPTH`), after which new nodes are
+        typed and value-numbered but their `idealize` is put on the worklist.
+        This keeps the Python stack bounded for long rewrite chains, such as
+        sorting a long additive spine.
+
+        Every time a node makes progress its neighbors go on the worklist:
+        - its uses, as they see a new input (or a new input type);
+        - its defs, if it was replaced, as they lost a use.
+    """
+    # Default number of peephole steps a single `iterate` may take.
+    # `None` means run until the worklist is empty.
+    BUDGET = None
+
+    class WorkList():
+        """
+            A FIFO of nodes; a node is on the list at most once.
+        """
+        def __init__(self):
+            self._es = deque()
+            self._on = set() # nids of the nodes on the list
+
+        def __len__(self):
+            return len(self._es)
+
+        def push(self, x):
+            if x is not None and x._nid not in self._on:
+                self._on.add(x._nid)
+                self._es.append(x)
+            return x
+
+        def pop(self):
+            if not self._es:
+                return None
+            x = self._es.popleft()
+            self._on.discard(x._nid)
+            return x
+
+        def clear(self):
+            self._es.clear()
+            self._on.clear()
+
+    @classmethod
+    def add(cls, n):
+        """
+            Put a node on the worklist of the current CompileContext; returns
+            the node for flow coding.
+        """
+        return CompileContext.current().work.push(n)
+
+    @classmethod
+    def add_all(cls, root):
+        """
+            Put every node reachable from root by input edges on the worklist,
+            for a whole-graph optimization pass.
+        """
+        ctx = CompileContext.current()
+        for n in Walker(ctx.node_count(), inputs).walk(root):
+            ctx.work.push(n)
+
+    @classmethod
+    def iterate(cls, stop, budget=None):
+        """
+            Drain the worklist of the current CompileContext, running
+            `peephole_opt` on each node until no more progress is made or the
+            budget of peephole steps runs out.  Work left over when the budget
+            runs out stays on the list.
+
+            @param stop the StopNode of the graph being optimized
+            @param budget maximum peephole steps, defaults to `IterPeeps.BUDGET`
+            @return stop for flow coding
+        """
+        if budget is None:
+            budget = cls.BUDGET
+        work = CompileContext.current().work
+        cnt = 0
+        while len(work):
+            if budget is not None and cnt >= budget:
+                break
+            n = work.pop()
+            if n.is_dead():
+                continue
+            cnt += 1
+            old = n._type
+            x = n.peephole_opt()
+            if x is None:
+                # No rewrite, but a better type is still news for the uses
+                if n._type != old:
+                    for z in n._outputs:
+                        work.push(z)
+                continue
+            if x.is_dead():
+                continue
+            # peephole_opt can return brand-new nodes, needing an initial type
+            if x._type is None:
+                x._type = x.compute()
+            # All outputs of n (the changing node), not x (a prior existing node)
+            for z in n._outputs:
+                work.push(z)
+            # Everybody gets a free "go again"
+            work.push(x)
+            if x is not n:
+                # All inputs of n, since they lose a use
+                for z in n._inputs:
+                    work.push(z)
+                n.subsume(x)
+        return stop
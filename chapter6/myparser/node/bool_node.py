@@ -4,6 +4,7 @@ from abc import abstractmethod
 from myparser.type import TypeInteger, BOTTOM
 
 class BoolNode(Node):
+    __slots__ = ()
     def __init__(self, lhs, rhs):
         super().__init__(None, lhs, rhs)
     
@@ -16,15 +17,10 @@ class BoolNode(Node):
         return self.__class__.__name__
     
     @override
-    def glabel(self):
-        return self.op()
-    
-    @override
-    def _print1(self, s: str):
-        s = self.In(1)._print0(s + "(")
-        s = self.In(2)._print0(s + self.op())
-        s += ")"
-        return s
+    def _print1(self, p):
+        self.In(1)._print0(p.append("("))
+        self.In(2)._print0(p.append(self.op()))
+        return p.append(")")
     
     @override
     def compute(self):
@@ -44,11 +40,13 @@ class BoolNode(Node):
     def idealize(self):
         # compare of same
         if self.In(1) == self.In(2):
-            return ConstantNode(TypeInteger.constant(1 if self.doOp(3, 3) else 0))
+            return self.rule("cmp-same", ConstantNode(TypeInteger.constant(1 if self.doOp(3, 3) else 0)))
         
         return None
     
 class EQ(BoolNode):
+    __slots__ = ()
+    GLABEL = "=="
     def __init__(self, lhs, rhs):
         super().__init__(lhs, rhs)
 
@@ -65,6 +63,8 @@ class EQ(BoolNode):
     
 
 class LT(BoolNode):
+    __slots__ = ()
+    GLABEL = "<"
     def __init__(self, lhs, rhs):
         super().__init__(lhs, rhs)
 
@@ -80,6 +80,8 @@ class LT(BoolNode):
         return LT(lhs, rhs)
 
 class LE(BoolNode):
+    __slots__ = ()
+    GLABEL = "<="
     def __init__(self, lhs, rhs):
         super().__init__(lhs, rhs)
 
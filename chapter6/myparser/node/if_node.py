@@ -3,6 +3,8 @@ from myparser.type import IF
 from typing_extensions import override
 
 class IfNode(MultiNode):
+    __slots__ = ()
+    GLABEL = "If"
     def __init__(self, ctrl, pred):
         super().__init__(ctrl, pred)
 
@@ -11,10 +13,8 @@ class IfNode(MultiNode):
         return "If"
 
     @override
-    def _print1(self, s):
-        s += "if( "
-        s = self.In(1)._print0(s)
-        return s + " )"
+    def _print1(self, p):
+        return self.In(1)._print0(p.append("if( ")).append(" )")
 
     @override
     def isCFG(self):
@@ -1,17 +1,28 @@
 from abc import abstractmethod
 from typing_extensions import override
 from myparser.type import Type, TypeTuple, BOTTOM
-from myparser.utils import BitVector
+from myparser.utils import Walker
+from myparser.iter_peeps import IterPeeps
+from myparser.compile_context import CompileContext
 
 class Node():
-    _unique_id = 1
-    _disablePeephole = False # allow disabling peephole so that we can observe the full graph.
+    """
+        A node of the Sea of Nodes graph.  Nodes get their id from, and are
+        optimized within, the current `CompileContext`.
+    """
+    # No per-instance __dict__: graphs hold a great many nodes.
+    __slots__ = ("_nid", "_inputs", "_outputs", "_out_pos", "_type", "_gvn_key")
+    # Nodes with more uses than this index their `_outputs`, see `add_use`.
+    OUT_POS_MIN = 16
+    # The graph label of the kinds of node that carry no per-node data
+    GLABEL = None
     def __init__(self, *args): # node can have zero or multi inputs.
-        self._nid = Node._unique_id
-        Node._unique_id += 1
+        self._nid = CompileContext.current().next_id()
         self._inputs = list(args)
         self._outputs = []
+        self._out_pos = None # use -> position(s) in `_outputs`, for nodes with many uses
         self._type = None
+        self._gvn_key = None # set while the node is in the GVN table
 
         for _input in self._inputs:
             if _input is not None:
@@ -23,22 +34,32 @@ class Node():
         return self.label() + str(self._nid)
 
     def glabel(self):
-        return self.label()
+        return self.label() if self.GLABEL is None else self.GLABEL
 
     def __repr__(self):
         return self.print()
 
-    def print(self):
-        return self._print0("")
+    def print(self, dag=False):
+        """
+            Print the node and its inputs as an expression.
+
+            @param dag print a node reached more than once as a single `let`
+                       binding, see `NodePrinter`
+        """
+        return NodePrinter(dag).print(self)
 
-    def _print0(self, s:str):
+    def _print0(self, p):
         if self.is_dead():
-            return f"{self.unique_name():DEAD}"
+            return p.append(f"{self.unique_name()}:DEAD")
         else:
-            return self._print1(s)
+            return p.node(self)
 
     @abstractmethod
-    def _print1(self, s:str):
+    def _print1(self, p):
+        """
+            Append this node to the NodePrinter p, calling `_print0` for the
+            inputs; returns p.
+        """
         pass
 
     def In(self, i: int):
@@ -72,6 +93,7 @@ class Node():
         old_def = self.In(idx)
         if old_def is new_def:
             return self # No change
+        self.unlock() # changing an input changes our GVN key
         # add new_def to the corresponding `def-use` edge
         # This needs to happen before removing old node's `def-use` edge as
         # the new_def might get killed if the old node kills it recursively.
@@ -90,33 +112,118 @@ class Node():
             @param new_def the new definition, appended to the end of existing definitions
             @return new_def for flow coding
         """
+        self.unlock()
         self._inputs.append(new_def)
         if new_def is not None:
             new_def.add_use(self)
         return new_def
 
     def add_use(self, n):
-        self._outputs.append(n)
+        """
+            Add a `def-use` edge; `n` may be `None` (see `keep`).
+            The outputs are a multiset: a use may appear more than once.
+
+            Most nodes have a handful of uses and just scan `_outputs`.  Once a
+            node with more than `OUT_POS_MIN` uses (START, say, which every
+            ConstantNode uses) loses one, it also maps each use to its
+            position in `_outputs`, so that `del_use` is constant time.  A
+            use that appears more than once maps to a list of its positions.
+            Nodes that only gain uses never pay for the map.
+        """
+        outs = self._outputs
+        if self._out_pos is not None:
+            _add_pos(self._out_pos, n, len(outs))
+        outs.append(n)
         return n
 
     def del_use(self, use):
-        if use in self._outputs:
-            self._outputs[self._outputs.index(use)] = self._outputs[-1] # set last ele into `use` position, so last ele can be removed.
-            self._outputs.pop()
-        return len(self._outputs) == 0
+        """
+            Remove one `def-use` edge, if any, by moving the last use into
+            its position.
+
+            @return True if self is now unused
+        """
+        outs = self._outputs
+        pos = self._out_pos
+        if pos is None and len(outs) > Node.OUT_POS_MIN:
+            pos = self._out_pos = {}
+            for i, n in enumerate(outs):
+                _add_pos(pos, n, i)
+        if pos is None:
+            try:
+                i = outs.index(use)
+            except ValueError:
+                return len(outs) == 0
+            last = outs.pop()
+            if i < len(outs):
+                outs[i] = last # set last ele into `use` position
+            return len(outs) == 0
+        ps = pos.get(use)
+        if ps is None:
+            return len(outs) == 0
+        if ps.__class__ is int:
+            i = ps
+            del pos[use]
+        else:
+            i = ps.pop()
+            if len(ps) == 1:
+                pos[use] = ps[0]
+        last = outs.pop()
+        if i < len(outs):
+            outs[i] = last # set last ele into `use` position
+            lps = pos[last]
+            if lps.__class__ is int:
+                pos[last] = i
+            else:
+                lps[lps.index(len(outs))] = i
+        return len(outs) == 0
 
     def popN(self, n: int):
+        if n > 0:
+            self.unlock() # changing inputs changes our GVN key
         for i in range(n):
             old_def = self._inputs.pop()
             if old_def is not None and old_def.del_use(self):
                 old_def.kill()
 
     def kill(self):
+        """
+            Kill an unused node, and then any of its inputs that go unused.
+            Uses an explicit stack, so long dead chains cannot overflow the
+            Python stack.
+        """
         assert(self.isUnused())
-        self.popN(self.nIns())
-        self._type = None
+        stats = CompileContext.current().stats
+        dead = [self]
+        while dead:
+            n = dead.pop()
+            if stats is not None:
+                stats.killed += 1
+            n.unlock()
+            while n._inputs:
+                old_def = n._inputs.pop()
+                if old_def is not None and old_def.del_use(n):
+                    dead.append(old_def)
+            n._type = None
         assert(self.is_dead())
 
+    def subsume(self, nnn):
+        """
+            Replace self with nnn in the graph: every use of self becomes a use
+            of nnn, then self is killed.
+        """
+        assert nnn is not self
+        while self.nOuts() > 0:
+            n = self._outputs[-1]
+            self.del_use(n)
+            if n is None: # move the keep-alive over
+                nnn.keep()
+                continue
+            n.unlock()
+            n._inputs[n._inputs.index(self)] = nnn
+            nnn.add_use(n)
+        self.kill()
+
     def is_dead(self):
         return self.isUnused() and self.nIns() == 0 and self._type == None
 
@@ -136,25 +243,107 @@ class Node():
     
     # --------------------------------------
     # Graph-based optimizations
+    MAX_PEEPHOLE_DEPTH = 50 # nested peepholes deeper than this defer `idealize` to the IterPeeps
+
     def peephole(self):
+        """
+            Optimize self, and whatever self is replaced with, until no more
+            progress is made.  Returns the optimized node, never `None`.
+
+            Loops on `peephole_opt` instead of recursing on each replacement.
+            `idealize` rules still call `peephole` on the new nodes they make;
+            when those nest too deeply the new node is only typed and value
+            numbered, and the rest of its optimization goes on the worklist.
+        """
+        ctx = CompileContext.current()
+        if ctx.disable_peephole: # without peephole
+            self._type = self.compute()
+            return self
+
+        if ctx.peephole_depth >= Node.MAX_PEEPHOLE_DEPTH:
+            n = self.peephole_opt(False)
+            if n is None:
+                IterPeeps.add(self)
+                return self
+            return self.deadCodeElim(n)
+
+        ctx.peephole_depth += 1
+        try:
+            n = self
+            while True:
+                x = n.peephole_opt()
+                if x is None:   # No progress
+                    return n
+                x = n.deadCodeElim(x)
+                # A pre-existing node is already optimized
+                if x is not n and x._nid < n._nid:
+                    return x
+                n = x
+        finally:
+            ctx.peephole_depth -= 1
+
+    def peephole_opt(self, idealize=True):
+        """
+            One step of peephole optimization; no recursion on the result.
+
+            @param idealize if False, only type, constant-fold and value number
+            @return a better node (which may be self, changed in place), or
+            `None` for no progress
+        """
+        ctx = CompileContext.current()
         # compute initial or improved Type
         type_ = self._type = self.compute()
 
-        if Node._disablePeephole: # without peephole
-            return self
-        
         # Replace constant computations from non-constants with a constant node
         if not isinstance(self, ConstantNode) and type_.is_constant():
-            return self.deadCodeElim(ConstantNode(type_).peephole())
-        
-        # Future chapter: Global Value Numbering
+            if ctx.stats is not None:
+                ctx.stats.hit(self, "fold")
+            return ConstantNode(type_).peephole()
+
+        # Global Value Numbering
+        if self._gvn_key is None and not self.isCFG():
+            key = self.gvn_key()
+            n = ctx.gvn.get(key)
+            if n is None:
+                ctx.gvn[key] = self # Put in table now
+                self._gvn_key = key
+            else:
+                if ctx.stats is not None:
+                    ctx.stats.hit(self, "gvn")
+                return n # Return previous; does Common Subexpression Elimination
 
         # Ask each node for a better replacement
-        n = self.idealize()
-        if n is not None:  # something changed
-            # Recursively optimize
-            return self.deadCodeElim(n.peephole())
-        return self        # No progress
+        if not idealize:
+            return None
+        return self.idealize() if ctx.stats is None else ctx.stats.idealize(self, ctx)
+
+    # --------------------------------------
+    # Global Value Numbering
+
+    def payload(self):
+        """
+            Per-node data other than the inputs that tells apart two nodes of the
+            same class, e.g. the constant of a ConstantNode.  Part of the GVN key.
+        """
+        return None
+
+    def gvn_key(self):
+        """
+            Two nodes are the same value if they have the same class, the same
+            payload and the very same inputs, in order.
+        """
+        return (self.__class__, self.payload(), *(None if n is None else n._nid for n in self._inputs))
+
+    def unlock(self):
+        """
+            Remove self from the GVN table.  Must be called before any change to
+            the inputs, as it changes the GVN key.
+        """
+        if self._gvn_key is None:
+            return
+        old = CompileContext.current().gvn.pop(self._gvn_key)
+        assert old is self
+        self._gvn_key = None
 
     def deadCodeElim(self, m):
         """
@@ -227,8 +416,21 @@ class Node():
     # ------------------------------
     # Peephole utilities
 
+    def rule(self, name, x):
+        """
+            Name the `idealize` rule that made x, for `PeepStats`.  Call it
+            last, after the nodes the rule makes are peepholed.
+
+            @return x for flow coding
+        """
+        stats = CompileContext.current().stats
+        if stats is not None:
+            stats._rule = name
+        return x
+
     # swap inputs without letting either input go dead during the swap.
     def swap12(self):
+        self.unlock()
         tmp = self.In(1)
         self._inputs[1] = self.In(2)
         self._inputs[2] = tmp
@@ -247,39 +449,21 @@ class Node():
     def copy(self, lhs, rhs):
         raise NotImplementedError("Binary ops need to implement copy")
 
-    @classmethod
-    def reset(cls):
-        cls._unique_id = 1
-        cls._disablePeephole = False
-
     def find(self, nid:int):
         """
             Debugging utility to find a Node by index.
         """
-        return self._find(BitVector(), nid)
-
-    def _find(self, visit: BitVector, nid: int):
-        if self._nid == nid:
-            return self
-        if visit.get(self._nid):
-            return None
-        visit.set(self._nid)
-        for def_ in self._inputs:
-            if def_ is not None:
-                rez = def_._find(visit, nid)
-                if rez is not None:
-                    return rez
-        for use in self._outputs:
-            rez = use._find(visit, nid)
-            if rez is not None:
-                return rez
+        ctx = CompileContext.active()
+        walker = Walker(ctx.node_count() if ctx is not None else nid + 1)
+        for n in walker.walk(self):
+            if n._nid == nid:
+                return n
         return None
-    
 
 class ConstantNode(Node):
+    __slots__ = ("_con",)
     def __init__(self, type_: Type):
-        from ..parser import Parser
-        super().__init__(Parser.START)
+        super().__init__(CompileContext.current().start)
         self._con = type_
 
     @override
@@ -291,8 +475,8 @@ class ConstantNode(Node):
         return f"Con_{self._nid}"
 
     @override
-    def _print1(self, s):
-        return self._con._print(s)
+    def _print1(self, p):
+        return p.append(self._con._print(""))
 
     @override
     def compute(self):
@@ -302,7 +486,13 @@ class ConstantNode(Node):
     def idealize(self):
         return None
 
+    @override
+    def payload(self):
+        return self._con
+
 class ReturnNode(Node):
+    __slots__ = ()
+    GLABEL = "Return"
     def __init__(self, ctrl, data):
         super().__init__(ctrl, data)
 
@@ -317,8 +507,8 @@ class ReturnNode(Node):
         return "Return"
 
     @override
-    def _print1(self, s: str):
-        return self.expr()._print0(s + "return ") + ";"
+    def _print1(self, p):
+        return self.expr()._print0(p.append("return ")).append(";")
 
     def isCFG(self) -> bool:
         return True
@@ -332,10 +522,13 @@ class ReturnNode(Node):
         return None
 
 class MultiNode(Node):
+    __slots__ = ()
     def __init__(self, *args):
         super().__init__(*args)
 
 class StartNode(MultiNode):
+    __slots__ = ("_args",)
+    GLABEL = "Start"
     def __init__(self, variables):
         super().__init__()
         self._args = TypeTuple(variables)
@@ -346,8 +539,8 @@ class StartNode(MultiNode):
         return "Start"
 
     @override
-    def _print1(self, s: str):
-        return s + self.label()
+    def _print1(self, p):
+        return p.append(self.label())
 
     def isCFG(self) -> bool:
         return True
@@ -361,6 +554,8 @@ class StartNode(MultiNode):
         return None
 
 class StopNode(Node):
+    __slots__ = ()
+    GLABEL = "Stop"
     def __init__(self, *inputs):
         super().__init__(*inputs)
 
@@ -369,13 +564,12 @@ class StopNode(Node):
         return "Stop"
     
     @override
-    def _print1(self, s: str):
-        if self.ret() is not None: return s + self.ret()._print0(s)
-        s += "Stop[ "
+    def _print1(self, p):
+        if self.ret() is not None: return self.ret()._print0(p)
+        p.append("Stop[ ")
         for ret in self._inputs:
-            s = ret._print0(s)
-            s += " "
-        return s + "]"
+            ret._print0(p).append(" ")
+        return p.append("]")
     
     @override
     def isCFG(self) -> bool:
@@ -397,4 +591,109 @@ class StopNode(Node):
         return None
 
     def add_return(self, node):
-        return self.add_def(node)
\ No newline at end of file
+        return self.add_def(node)
+
+
+def _add_pos(pos, use, i):
+    """
+        Note position i of use in an `_out_pos` map: an int for a use seen
+        once, a list once it is seen again.
+    """
+    ps = pos.get(use)
+    if ps is None:
+        pos[use] = i
+    elif ps.__class__ is int:
+        pos[use] = [ps, i]
+    else:
+        ps.append(i)
+
+
+class NodePrinter():
+    """
+        The buffer a graph prints into.  `_print0`/`_print1` append pieces
+        and the pieces are joined once at the end, so printing is linear in
+        the size of the output.
+
+        `_print0` of an input does not print it right away: `node` appends
+        the node itself, and `print` expands the nodes in the buffer with an
+        explicit stack, so a deep graph cannot overflow the Python stack.
+
+        By default a node is printed in full at every use, as a tree.  With
+        `dag=True` a node that prints its inputs and is reached more than
+        once is printed only once, as a `let` binding ahead of the
+        expression, and referred to by its unique name after:
+
+            let Add7=(arg+1); return (Add7*Add7);
+
+        so a deep chain of shared nodes prints in linear, not exponential,
+        space.  Finding the shared nodes takes a first, counting, pass.
+    """
+    __slots__ = ("_sb", "_dag", "_uses", "_inner", "_names", "_lets")
+
+    def __init__(self, dag=False):
+        self._sb = []
+        self._dag = dag
+        self._uses = {}    # nid -> times reached, from the counting pass
+        self._inner = set() # nids of the nodes that print some input
+        self._names = {}   # nid -> name, of the nodes bound so far
+        self._lets = []
+
+    def append(self, s: str):
+        self._sb.append(s)
+        return self
+
+    def node(self, n: Node):
+        """
+            Print n, once `print` gets to it.
+        """
+        self._sb.append(n)
+        return self
+
+    def _expand(self, n: Node):
+        """
+            The pieces n prints itself as: strings, and the nodes of its
+            inputs still to print.
+        """
+        sb, self._sb = self._sb, []
+        n._print1(self)
+        pieces, self._sb = self._sb, sb
+        return pieces
+
+    def _count(self, root: Node):
+        root._print0(self)
+        stack, self._sb = self._sb, []
+        while stack:
+            n = stack.pop()
+            if isinstance(n, str): continue
+            cnt = self._uses.get(n._nid, 0)
+            self._uses[n._nid] = cnt + 1
+            if cnt == 0:
+                pieces = [x for x in self._expand(n) if not isinstance(x, str)]
+                if pieces:
+                    self._inner.add(n._nid)
+                    stack.extend(pieces)
+
+    def print(self, root: Node) -> str:
+        if self._dag:
+            self._count(root)
+        root._print0(self)
+        stack, out = self._sb[::-1], []
+        while stack:
+            x = stack.pop()
+            if isinstance(x, str):
+                out.append(x)
+            elif isinstance(x, tuple): # End of a let body
+                nid, name, outer = x
+                self._names[nid] = name
+                self._lets.append(f"let {name}={''.join(out)}; ")
+                out = outer
+                out.append(name)
+            elif not self._dag or x._nid not in self._inner or self._uses[x._nid] < 2:
+                stack.extend(reversed(self._expand(x)))
+            elif x._nid in self._names:
+                out.append(self._names[x._nid])
+            else:
+                stack.append((x._nid, x.unique_name(), out))
+                stack.extend(reversed(self._expand(x)))
+                out = []
+        return "".join(self._lets) + "".join(out)
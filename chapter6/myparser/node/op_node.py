@@ -4,6 +4,8 @@ from typing_extensions import override
 from myparser.type import Type, TypeInteger, BOTTOM, ZERO
 
 class AddNode(Node):
+    __slots__ = ()
+    GLABEL = "+"
     def __init__(self, lhs, rhs):
         super().__init__(None, lhs, rhs)
 
@@ -12,14 +14,10 @@ class AddNode(Node):
         return "Add"
 
     @override
-    def glabel(self):
-        return "+"
-
-    @override
-    def _print1(self, s:str) -> str:
-        s = self.In(1)._print0(s+"(")
-        s = self.In(2)._print0(s+"+")
-        return s+")"
+    def _print1(self, p):
+        self.In(1)._print0(p.append("("))
+        self.In(2)._print0(p.append("+"))
+        return p.append(")")
 
     @override
     def compute(self) -> Type:
@@ -44,34 +42,34 @@ class AddNode(Node):
         # Add of 0. We do not check for (0+x) because this will already
         # canonicalize to (x+0)
         if isinstance(t2, TypeInteger) and t2.value() == 0:
-            return lhs
+            return self.rule("add-zero", lhs)
         
         # Add of same to a multipy by 2
         if lhs == rhs:
-            return MulNode(lhs, ConstantNode(TypeInteger.constant(2)).peephole())
+            return self.rule("add-same", MulNode(lhs, ConstantNode(TypeInteger.constant(2)).peephole()))
         
         # Goal: a left-spine set of adds, with constants on the rhs (which then fold).
 
         # Move non-adds to RHS
         if not isinstance(lhs, AddNode) and isinstance(rhs, AddNode):
-            return self.swap12()
+            return self.rule("add-swap", self.swap12())
         
         # Now we might see (add add non) or (add non non) or (add add add) but never (add non add)
 
         # Swap `x+(y+z)` to `(x+y)+z`
         # Rotate (add add add) to remove the add on RHS
         if isinstance(rhs, AddNode):
-            return AddNode(AddNode(lhs, rhs.In(1)).peephole(), rhs.In(2))
+            return self.rule("add-rotate", AddNode(AddNode(lhs, rhs.In(1)).peephole(), rhs.In(2)))
         
         # Now we might see (add add non) or (add non non) but never (add non add) nor (add add add)
         if not isinstance(lhs, AddNode):
-            return self.swap12() if self.spline_cmp(lhs, rhs) else None
+            return self.rule("add-sort", self.swap12()) if self.spline_cmp(lhs, rhs) else None
         
         # Now we only see (add add non)
 
         # Replace `(x+con1)+con2` with `x+(con1+con2)`, which then fold the constants.
         if lhs.In(2)._type.is_constant() and t2.is_constant():
-            return AddNode(lhs.In(1), AddNode(lhs.In(2), rhs).peephole())
+            return self.rule("add-fold", AddNode(lhs.In(1), AddNode(lhs.In(2), rhs).peephole()))
 
         # Do we have ((x+(phi cons)) + con) ?
         # Push constant up through the phi: x + (phi con0+con con1+con...)
@@ -87,14 +85,14 @@ class AddNode(Node):
             for i in range(1, phi.nIns()):
                 ns[i] = AddNode(phi.In(i), rhs if t2.is_constant() else rhs.In(i)).peephole()
             label = phi._label + rhs._label if isinstance(rhs, PhiNode) else ""
-            return AddNode(lhs.In(1), PhiNode(label, *ns).peephole())   # we don't get in an endless peephole cycle here
-                                                                        # because the constants all fold first.
+            # We don't get in an endless peephole cycle here because the constants all fold first.
+            return self.rule("add-phi", AddNode(lhs.In(1), PhiNode(label, *ns).peephole()))
 
         # Now we sort along the spline via rotates, to gather similar things together.
 
         # rotate `(x+y)+z` to `(x+z)+y`
         if self.spline_cmp(lhs.In(2), rhs):
-            return AddNode(AddNode(lhs.In(1), rhs).peephole(), lhs.In(2))
+            return self.rule("add-sort-spine", AddNode(AddNode(lhs.In(1), rhs).peephole(), lhs.In(2)))
 
         return None
 
@@ -107,17 +105,19 @@ class AddNode(Node):
             Ties with in a category sort by node ID.
             `True` if swapping hi and lo.
         """
-        if lo._type.is_constant(): return False
-        if hi._type.is_constant(): return True
-
-        if isinstance(lo, PhiNode) and lo.allCons(): return False
-        if isinstance(hi, PhiNode) and hi.allCons(): return True
-
-        if isinstance(lo, PhiNode) and not isinstance(hi, PhiNode): return True
-        if isinstance(hi, PhiNode) and not isinstance(lo, PhiNode): return False
+        return AddNode.spline_key(hi) < AddNode.spline_key(lo)
 
-        # Same category of "others"
-        return lo._nid > hi._nid
+    @staticmethod
+    def spline_key(n):
+        """
+            Where n goes along the spine: the larger the key, the deeper.
+            Constants, then Phi-of-constants, keep their order among
+            themselves; other nodes, then other Phis, sort by node ID.
+        """
+        if n._type.is_constant(): return (0, 0)
+        if isinstance(n, PhiNode):
+            return (1, 0) if n.allCons() else (3, n._nid)
+        return (2, n._nid)
 
     @override
     def copy(self, lhs, rhs):
@@ -125,6 +125,8 @@ class AddNode(Node):
         
 
 class SubNode(Node):
+    __slots__ = ()
+    GLABEL = "-"
     def __init__(self, lhs, rhs):
         super().__init__(None, lhs, rhs)
 
@@ -133,15 +135,10 @@ class SubNode(Node):
         return "sub"
 
     @override
-    def glabel(self):
-        return "-"
-
-    @override
-    def _print1(self, s: str):
-        s = self.In(1)._print0(s + "(")
-        s = self.In(2)._print0(s + "-")
-        s += ")"
-        return s
+    def _print1(self, p):
+        self.In(1)._print0(p.append("("))
+        self.In(2)._print0(p.append("-"))
+        return p.append(")")
 
     @override
     def compute(self) -> Type:
@@ -162,6 +159,8 @@ class SubNode(Node):
         return SubNode(lhs, rhs)
 
 class MinusNode(Node):
+    __slots__ = ()
+    GLABEL = "-"
     def __init__(self, input_):
         super().__init__(None, input_)
 
@@ -170,13 +169,8 @@ class MinusNode(Node):
         return "Minus"
 
     @override
-    def glabel(self):
-        return "-"
-
-    @override
-    def _print1(self, s:str) -> str:
-        s = self.In(1)._print0(s+"(-")
-        return s+")"
+    def _print1(self, p):
+        return self.In(1)._print0(p.append("(-")).append(")")
 
     @override
     def compute(self) -> Type:
@@ -190,6 +184,8 @@ class MinusNode(Node):
         return None
 
 class MulNode(Node):
+    __slots__ = ()
+    GLABEL = "*"
     def __init__(self, lhs, rhs):
         super().__init__(None, lhs, rhs)
 
@@ -198,14 +194,10 @@ class MulNode(Node):
         return "Mul"
 
     @override
-    def glabel(self):
-        return "*"
-
-    @override
-    def _print1(self, s:str) -> str:
-        s = self.In(1)._print0(s+"(")
-        s = self.In(2)._print0(s+"*")
-        return s+")"
+    def _print1(self, p):
+        self.In(1)._print0(p.append("("))
+        self.In(2)._print0(p.append("*"))
+        return p.append(")")
 
     @override
     def compute(self) -> Type:
@@ -227,11 +219,11 @@ class MulNode(Node):
         # Mul of 1. We do not check for (1*x) because this will already
         # canonicalize to (x*1)
         if (t2.is_constant() and isinstance(t2, TypeInteger) and t2.value() == 1):
-            return lhs
+            return self.rule("mul-one", lhs)
         
         # Move constants to RHS: con*arg becomes arg*con
         if t1.is_constant() and not t2.is_constant():
-            return self.swap12()
+            return self.rule("mul-swap", self.swap12())
 
         return None
     
@@ -240,6 +232,8 @@ class MulNode(Node):
         return MulNode(lhs, rhs)
 
 class DivNode(Node):
+    __slots__ = ()
+    GLABEL = "//"
     def __init__(self, lhs, rhs):
         super().__init__(None, lhs, rhs)
 
@@ -248,14 +242,10 @@ class DivNode(Node):
         return "Div"
 
     @override
-    def glabel(self):
-        return "//"
-
-    @override
-    def _print1(self, s:str) -> str:
-        s = self.In(1)._print0(s+"(")
-        s = self.In(2)._print0(s+"/")
-        return s+")"
+    def _print1(self, p):
+        self.In(1)._print0(p.append("("))
+        self.In(2)._print0(p.append("/"))
+        return p.append(")")
 
     @override
     def compute(self) -> Type:
@@ -276,6 +266,8 @@ class DivNode(Node):
         return DivNode(lhs, rhs)
 
 class NotNode(Node):
+    __slots__ = ()
+    GLABEL = "!"
     def __init__(self, in_):
         super().__init__(None, in_)
 
@@ -284,13 +276,8 @@ class NotNode(Node):
         return "Not"
 
     @override
-    def glabel(self):
-        return "!"
-
-    @override
-    def _print1(self, s: str):
-        s = self.In(1)._print0(s + "(!")
-        return s + ")"
+    def _print1(self, p):
+        return self.In(1)._print0(p.append("(!")).append(")")
     
     @override
     def compute(self):
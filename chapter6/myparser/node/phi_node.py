@@ -3,6 +3,7 @@ from myparser.type import BOTTOM
 from typing_extensions import override
 
 class PhiNode(Node):
+    __slots__ = ("_label",)
     def __init__(self, label:str, *inputs):
         super().__init__(*inputs)
         self._label = label
@@ -16,14 +17,12 @@ class PhiNode(Node):
         return "&phi;_" + self._label
 
     @override
-    def _print1(self, s):
-        s += "Phi("
-        for node in self._inputs:
-            s = node._print0(s)
-            s += ","
-        s = s[:-1] # exculde last ','
-        s += ")"
-        return s
+    def _print1(self, p):
+        p.append("Phi(")
+        for i, node in enumerate(self._inputs):
+            if i: p.append(",")
+            node._print0(p)
+        return p.append(")")
 
     def region(self):
         return self.In(0)
@@ -36,7 +35,7 @@ class PhiNode(Node):
     def idealize(self):
         # remove a "junk" Phi: Phi(x,x) is just x
         if self.same_inputs():
-            return self.In(1)
+            return self.rule("phi-same", self.In(1))
         
         # Phi(op(A,B),op(Q,R),op(X,Y)) becomes
         #   op(Phi(A,Q,X), Phi(B,R,Y)).
@@ -51,7 +50,7 @@ class PhiNode(Node):
                 rhss[i] = self.In(i).In(2)
             phi_lhs = PhiNode(self._label, *lhss).peephole()
             phi_rhs = PhiNode(self._label, *rhss).peephole()
-            return op.copy(phi_lhs, phi_rhs)
+            return self.rule("phi-push-op", op.copy(phi_lhs, phi_rhs))
         return None
     
     def same_op(self):
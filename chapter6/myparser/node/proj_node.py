@@ -3,6 +3,7 @@ from typing_extensions import override
 from myparser.type import TypeTuple, BOTTOM
 
 class ProjNode(Node):
+    __slots__ = ("_idx", "_label")
     def __init__(self, ctrl, idx, label):
         super().__init__(ctrl)
         self._idx = idx
@@ -13,8 +14,8 @@ class ProjNode(Node):
         return self._label
 
     @override
-    def _print1(self, s: str):
-        return s + self._label
+    def _print1(self, p):
+        return p.append(self._label)
 
     @override
     def isCFG(self) -> bool:
@@ -30,4 +31,8 @@ class ProjNode(Node):
 
     @override
     def idealize(self):
-        return None
\ No newline at end of file
+        return None
+
+    @override
+    def payload(self):
+        return self._idx
\ No newline at end of file
@@ -3,6 +3,8 @@ from myparser.type import CONTROL
 from typing_extensions import override
 
 class RegionNode(Node):
+    __slots__ = ()
+    GLABEL = "Region"
     def __init__(self, *inputs):
         super().__init__(*inputs)
 
@@ -11,8 +13,8 @@ class RegionNode(Node):
         return "Region"
     
     @override
-    def _print1(self, s: str):
-        return s + self.label() + str(self._nid)
+    def _print1(self, p):
+        return p.append(self.label() + str(self._nid))
     
     @override
     def isCFG(self) -> bool:
@@ -8,12 +8,33 @@ class ScopeNode(Node):
     """
         The Scope node is purely a parser helper
         - it tracks names to nodes with a stack of scopes.
+
+        Each name is bound to a slot, numbered in order of definition; slot
+        0 is '$ctrl'.  A ScopeNode made by `dup` is a copy-on-write overlay
+        of the scope it was duplicated from: it holds only the bindings that
+        differ, and reads the rest through its parent.  When the parent
+        rebinds a slot its overlays still read, it first gives them the old
+        binding.  So `dup` is O(1), and an overlay's own slots are the names
+        rebound on either side since the dup: `merge_scopes` visits only those.
+        The names of the slots are kept the same way, see `name`.
+
+        Names resolve through one dict, from a name to the stack of slots
+        it is bound to, innermost last; an overlay's dict only has the names
+        it defined itself.
     """
     CTRL = "$ctrl"
     ARG0 = "arg"
-    def __init__(self):
+    __slots__ = ("_scopes", "_index", "_nslots", "_names", "_own", "_parent", "_base", "_deps")
+    def __init__(self, parent=None):
         super().__init__()
         self._scopes = []
+        self._index = {}    # name -> slots, innermost last
+        self._nslots = 0
+        self._names = []    # names of the slots from _base on
+        self._own = None    # slot -> input, for an overlay; None if input i is slot i
+        self._parent = parent
+        self._base = 0      # slots an overlay shares with its parent
+        self._deps = []     # overlays reading through this scope
         self._type = BOTTOM
 
     @override
@@ -21,30 +42,35 @@ class ScopeNode(Node):
         return "Scope"
     
     @override
-    def _print1(self, s: str):
-        s += self.label()
+    def _print1(self, p):
+        p.append(self.label())
         for scope in self._scopes:
-            s += "["
+            p.append("[")
             first = True
             for name in scope.keys():
                 if not first:
-                    s += ", "
+                    p.append(", ")
                 first = False
-                s += f"{name}:"
-                n = self.In(scope.get(name))
+                p.append(f"{name}:")
+                n = self.binding(scope.get(name))
                 if n is None:
-                    s += "null"
+                    p.append("null")
                 else:
-                    s = n._print0(s)
-            s += "]"
-        return s
+                    n._print0(p)
+            p.append("]")
+        return p
 
     def reverse_names(self):
-        names = []
-        for syms in self._scopes:
-            for name in syms.keys():
-                names.insert(syms.get(name), name)
-        return names
+        return [self.name(i) for i in range(self._nslots)]
+
+    def name(self, slot):
+        """
+            The name bound to a slot.
+        """
+        s = self
+        while slot < s._base:
+            s = s._parent
+        return s._names[slot - s._base]
     
     @override
     def compute(self):
@@ -53,12 +79,73 @@ class ScopeNode(Node):
     @override
     def idealize(self):
         return None
+
+    def nslots(self):
+        """
+            Number of names bound, across all levels.
+        """
+        return self._nslots
+
+    def binding(self, slot):
+        """
+            The node bound to a slot.
+        """
+        s = self
+        while s._own is not None:
+            i = s._own.get(slot)
+            if i is not None:
+                return s.In(i)
+            s = s._parent
+        return s.In(slot)
+
+    def _bind(self, slot, n: Node):
+        """
+            Rebind a slot, first giving the old binding to any overlay still
+            reading it from here.
+        """
+        for d in self._deps:
+            if slot < d._base and slot not in d._own:
+                d._own[slot] = d.nIns()
+                d.add_def(self.binding(slot))
+        if self._own is None:
+            return self.set_def(slot, n)
+        i = self._own.get(slot)
+        if i is None:
+            self._own[slot] = self.nIns()
+            return self.add_def(n)
+        return self.set_def(i, n)
+
+    def _drop(self, slot):
+        """
+            Remove the binding of an overlay's own slot.
+        """
+        i = self._own.pop(slot)
+        last = self.nIns() - 1
+        if i != last:
+            # Move the last binding into the hole
+            moved = next(s for s, j in self._own.items() if j == last)
+            self._own[moved] = i
+            self.set_def(i, self.In(last))
+        self.popN(1)
     
     def push(self):
         self._scopes.append({})
 
     def pop(self):
-        self.popN(len(self._scopes.pop()))
+        syms = self._scopes.pop()
+        self._nslots -= len(syms)
+        if syms:
+            del self._names[-len(syms):]
+        for name in syms:
+            slots = self._index[name]
+            slots.pop()
+            if not slots:
+                del self._index[name]
+        if self._own is None:
+            self.popN(len(syms))
+        else:
+            for slot in syms.values():
+                self._drop(slot)
 
     def define(self, name, n: Node):
         """
@@ -66,9 +153,14 @@ class ScopeNode(Node):
         """
         syms = self._scopes[-1]
         if name in syms: # double define, no need to add def
-            syms[name] = self.nIns()
+            syms[name] = self._nslots
             return None
-        syms[name] = self.nIns()
+        slot = syms[name] = self._nslots
+        self._nslots += 1
+        self._names.append(name)
+        self._index.setdefault(name, []).append(slot)
+        if self._own is not None:
+            self._own[slot] = self.nIns()
         return self.add_def(n)
 
     def lookup(self, name):
@@ -77,25 +169,33 @@ class ScopeNode(Node):
 
             @param name Name to be looked up
         """
-        return self.update(name, None, len(self._scopes)-1)
+        return self.update(name, None)
 
-    def update(self, name, node:Node, nestingLevel=None):
+    def update(self, name, node:Node):
         """
-            Both recursive lookup and update.
+            Both lookup and update.
             A shared implementation allows us to create lazy phis both during
             lookups and updates; the lazy phi creation is part of chapter 8.
         """
-        if nestingLevel == None:
-            nestingLevel = len(self._scopes) - 1
-        if nestingLevel < 0: # no scopes found.
+        slot = self.slot(name)
+        if slot is None: # no scopes found.
             return None
-        syms = self._scopes[nestingLevel]
-        if name not in syms: # not found in this scope, recursively look up
-            return self.update(name, node, nestingLevel-1)
-        idx = syms.get(name)
-        old = self.In(idx)
+        old = self.binding(slot)
+        # Chapter 8's lazy phis go here: every read and write of a name passes through
         # if node is None, we are doing lookup rather than update, hence return existing value
-        return old if node == None else self.set_def(idx, node)
+        return old if node == None else self._bind(slot, node)
+
+    def slot(self, name):
+        """
+            The slot of the innermost binding of a name, `None` if unbound.
+        """
+        s = self
+        while s is not None:
+            slots = s._index.get(name)
+            if slots:
+                return slots[-1]
+            s = s._parent
+        return None
 
     def ctrl(self):
         return self.In(0)
@@ -119,19 +219,18 @@ class ScopeNode(Node):
             neither shallow (would dup the Scope but not the internal HashMap
             tables), nor deep (would dup the Scope, the HashMap tables, but then
             also the program Nodes).
-            
-            The new Scope is a full-fledged Node with proper use<->def edges.
-        """
-        dup = ScopeNode()
-        # Our goals are:
-        # 1) duplicate the name bindings of the ScopeNode across all stack levels
-        # 2) Make the new ScopeNode a user of all the nodes bound
-        # 3) Ensure that the order of defs is the same to allow easy merging
-        for syms in self._scopes:
-            dup._scopes.append(syms)
+
+            The new Scope is an overlay with only its own '$ctrl'; every
+            other name reads through self until one of the two rebinds it.
+        """
+        dup = ScopeNode(self)
+        # The name tables are shared: an arm of an if may not define names
+        # in them, and names defined in nested blocks go in new tables
+        dup._scopes = list(self._scopes)
+        dup._nslots = dup._base = self._nslots
+        dup._own = {0: 0}
         dup.add_def(self.ctrl())
-        for i in range(1, self.nIns()):
-            dup.add_def(self.In(i))
+        self._deps.append(dup)
         return dup
     
     def merge_scopes(self, that):
@@ -140,14 +239,16 @@ class ScopeNode(Node):
             The names could occur at all stack levels, but a given name can only differ in the
             innermost stack level where the name is bound.
 
-            @param that The ScopeNode to be merged into this
+            @param that The ScopeNode dup'ed from this, to be merged into this
             @return A new node representing the merge point
         """
         r = self.ctrln(RegionNode(None, self.ctrl(), that.ctrl()).peephole())
-        ns = self.reverse_names()
-        # Note that we skip i==0, which is bound to '$ctrl'
-        for i in range(1, self.nIns()):
-            if self.In(i) != that.In(i): # No need for redundant Phis
-                self.set_def(i, PhiNode(ns[i], r, self.In(i), that.In(i)).peephole())
+        self._deps.remove(that)
+        # Every name rebound on either side since the dup is one of that's own
+        for i in sorted(that._own):
+            if i == 0 or i >= that._base: # Skip '$ctrl' and names local to that
+                continue
+            if self.binding(i) != that.binding(i): # No need for redundant Phis
+                self._bind(i, PhiNode(self.name(i), r, self.binding(i), that.binding(i)).peephole())
         that.kill()   # kill merged scope
-        return r
\ No newline at end of file
+        return r
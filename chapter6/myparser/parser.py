@@ -1,6 +1,11 @@
+import re
+from array import array
 from .node import *
 from .type import *
 from .graph_visualizer import GraphVisualizer
+from .graph_renderer import GraphRenderer
+from .iter_peeps import IterPeeps
+from .compile_context import CompileContext
 
 class Parser():
     """
@@ -8,23 +13,36 @@ class Parser():
         representation directly in one pass. There is no intermediate Abstract
         Syntax Tree structure.
         
-        This is a simple recursive descent parser. All lexical analysis is done here as well.
+        This is a simple recursive descent parser over the token stream of its
+        `Lexer`. All lexical analysis is done here as well.
     """
-    # class variable for static use.
-    START = None
     # List of keywords disallowed as identifiers.
     KEYWORDS = ["else", "false", "if", "int", "return", "true"]
-    def __init__(self, source: str, arg=None):
+    def __init__(self, source: str, arg=None, stats=None):
         if arg is None:
             arg = BOT
-        Node.reset()
+        # All the state of this compilation; entered whenever we build nodes
+        self.ctx = CompileContext()
+        # A PeepStats counts and times the peephole rules, and reports at the end of parse
+        self.ctx.stats = stats
         self._lexer = self.Lexer(source)
-        self._scope = ScopeNode()
-        # We clone ScopeNodes when control flows branch; it is useful to have
-        # a list of all active ScopeNodes for purposes of visualization of the SoN graph
-        self.xScopes = []
-        Parser.START = StartNode([CONTROL, arg])
-        Parser.STOP = StopNode()
+        with self.ctx:
+            self._scope = ScopeNode()
+            # We clone ScopeNodes when control flows branch; it is useful to have
+            # a list of all active ScopeNodes for purposes of visualization of the SoN graph
+            self.xScopes = []
+            # Renders the graph for showGraph; None uses GraphRenderer.shared()
+            self.renderer = None
+            self.ctx.start = StartNode([CONTROL, arg])
+            self.ctx.stop = StopNode()
+
+    @property
+    def START(self) -> StartNode:
+        return self.ctx.start
+
+    @property
+    def STOP(self) -> StopNode:
+        return self.ctx.stop
 
     def __repr__(self):
         return self._lexer.__repr__()
@@ -36,7 +54,7 @@ class Parser():
         """
             Debugging utility to find a Node by index
         """
-        return Parser.START.find(nid)
+        return self.START.find(nid)
 
     def ctrl(self):
         return self._scope.ctrl()
@@ -45,20 +63,26 @@ class Parser():
         return self._scope.ctrln(n)
 
     def parse(self, show=False) -> ReturnNode:
-        self.xScopes.append(self._scope)
-        # Enter a new scope for the initial control and arguments
-        self._scope.push()
-        self._scope.define(ScopeNode.CTRL, ProjNode(Parser.START, 0, ScopeNode.CTRL).peephole())
-        self._scope.define(ScopeNode.ARG0, ProjNode(Parser.START, 1, ScopeNode.ARG0).peephole())
-        self.parseBlock()
-        self._scope.pop()
-        self.xScopes.pop()
-        if not self._lexer.is_eof():
-            self.error(f"Syntax error, unexpected {self._lexer.getAnyNextToken()}")
-        Parser.STOP.peephole()
-        if show:
-            self.showGraph()
-        return Parser.STOP
+        with self.ctx:
+            self.xScopes.append(self._scope)
+            # Enter a new scope for the initial control and arguments
+            self._scope.push()
+            self._scope.define(ScopeNode.CTRL, ProjNode(self.START, 0, ScopeNode.CTRL).peephole())
+            self._scope.define(ScopeNode.ARG0, ProjNode(self.START, 1, ScopeNode.ARG0).peephole())
+            self.parseBlock()
+            self._scope.pop()
+            self.xScopes.pop()
+            if not self._lexer.is_eof():
+                self.error(f"Syntax error, unexpected {self._lexer.getAnyNextToken()}")
+            self.STOP.peephole()
+            if not self.ctx.disable_peephole:
+                # Finish any peephole work deferred during parsing
+                IterPeeps.iterate(self.STOP)
+            if self.ctx.stats is not None:
+                self.ctx.stats.report()
+            if show:
+                self.showGraph()
+            return self.STOP
 
     def parseBlock(self):
         """ Block
@@ -106,7 +130,7 @@ class Parser():
 
         # In if true branch, the ifT proj node becomes the ctrl
         # But first clone the scope and set it as current
-        ndefs = self._scope.nIns()
+        ndefs = self._scope.nslots()
         f_scope = self._scope.dup() # Duplicate current scope
         self.xScopes.append(f_scope) # For graph visualization
 
@@ -122,7 +146,7 @@ class Parser():
             self.parseStatement()
             f_scope = self._scope
 
-        if t_scope.nIns() != ndefs or f_scope.nIns() != ndefs:
+        if t_scope.nslots() != ndefs or f_scope.nslots() != ndefs:
             return self.error("Cannot define a new name on one arm of an if")
 
         # Merge results
@@ -139,20 +163,21 @@ class Parser():
             @return an expression `Node`, never `None`
         """
         expr = self.require(self.parseExpression(), ";")
-        ret = Parser.STOP.add_return(ReturnNode(self.ctrl(), expr).peephole())
+        ret = self.STOP.add_return(ReturnNode(self.ctrl(), expr).peephole())
         self.ctrln(None)  # kill control
         return ret
 
     def showGraph(self):
         """
-            Dumps out the node graph
+            Dumps out the node graph.  The dot text streams to a file here;
+            the `GraphRenderer` renders it in the background.  The shared
+            renderer writes to `simple-graphs` in the temp directory, not to
+            `graph.dot` and `graph.png` in the current one.
 
             @return `None`
         """
-        with open("graph.dot", 'w') as f:
-            f.write(GraphVisualizer().generate_dot_output(self))
-        import os
-        os.system("dot -Tpng graph.dot -o graph.png")
+        renderer = self.renderer or GraphRenderer.shared()
+        renderer.submit(lambda out: GraphVisualizer().write_dot(self, out))
         return None
 
     def parseExpressionStatement(self):
@@ -188,44 +213,96 @@ class Parser():
 
             @return an expression `Node`, never `None`
         """
-        return self.parseComparison()
+        return self.parseBinary(0)
+
+    # Binary operators: token -> (binding power, node builder).  All are left
+    # associative; a higher binding power binds tighter.
+    #   compareExpr        : additiveExpr (('==' | '!=' | '<' | '<=' | '>' | '>=') additiveExpr)*
+    #   additiveExpr       : multiplicativeExpr (('+' | '-') multiplicativeExpr)*
+    #   multiplicativeExpr : unaryExpr (('*' | '/') unaryExpr)*
+    BINARY_OPS = {
+        "==": (1, lambda lhs, rhs: EQ(lhs, rhs)),
+        "!=": (1, lambda lhs, rhs: NotNode(EQ(lhs, rhs).peephole())),
+        "<":  (1, lambda lhs, rhs: LT(lhs, rhs)),
+        "<=": (1, lambda lhs, rhs: LE(lhs, rhs)),
+        ">":  (1, lambda lhs, rhs: LT(rhs, lhs)),
+        ">=": (1, lambda lhs, rhs: LE(rhs, lhs)),
+        "+":  (2, lambda lhs, rhs: AddNode(lhs, rhs)),
+        "-":  (2, lambda lhs, rhs: SubNode(lhs, rhs)),
+        "*":  (3, lambda lhs, rhs: MulNode(lhs, rhs)),
+        "/":  (3, lambda lhs, rhs: DivNode(lhs, rhs)),
+    }
+
+    def parseBinary(self, min_bp: int):
+        """ Parse a run of binary operators binding tighter than min_bp,
+            by precedence climbing over `BINARY_OPS`.  A chain of operators
+            of the same precedence is a loop, not a recursion, so the Python
+            stack depth is bounded by the number of precedence levels.
 
-    def parseComparison(self):
-        """ Parse an expression of the form:
-            compareExpr : additiveExpr op additiveExpr
-
-            @return a comparator expression `Node`, never `None`
+            @return an expression `Node`, never `None`
+        """
+        lhs = self.parseUnary()
+        while True:
+            op = self.peekBinary()
+            if op is None or op[0] <= min_bp:
+                return lhs
+            plus = self._lexer.text() == "+"
+            self._lexer.advance()
+            # With value numbering rhs may share nodes with lhs; keep lhs alive
+            # should they die while rhs is optimized
+            lhs.keep()
+            if plus:
+                lhs = self.parseSum(lhs, op[0])
+                continue
+            rhs = self.parseBinary(op[0])
+            lhs = op[1](lhs.unkeep(), rhs).peephole()
+
+    def peekBinary(self):
+        """
+            @return the `BINARY_OPS` entry of the next token, `None` if it is
+            not a binary operator
         """
-        lhs = self.parseAddition()
-        if self.match("=="): return EQ(lhs, self.parseComparison()).peephole()
-        if self.match("!="): return NotNode(EQ(lhs, self.parseComparison()).peephole()).peephole()
-        if self.match("<"): return LT(lhs, self.parseComparison()).peephole()
-        if self.match("<="): return LE(lhs, self.parseComparison()).peephole()
-        if self.match(">"): return LE(self.parseComparison(), lhs).peephole()
-        if self.match(">="): return LE(self.parseComparison(), lhs).peephole()
-        return lhs
+        return Parser.BINARY_OPS.get(self._lexer.text()) if self._lexer.kind() == Parser.Lexer.PUNCT else None
 
-    def parseAddition(self):
-        """ Parse an additive expression
-            additiveExpr : multiplicativeExpr (('+' | '-') multiplicativeExpr)*
+    def parseSum(self, lhs, bp: int):
+        """ Parse the rest of a run of '+', the first already parsed, and
+            add up the terms.
 
-            @return an add expression `Node`, never `None`
-        """
-        lhs = self.parseMultiplication()
-        if self.match("+"): return AddNode(lhs, self.parseAddition()).peephole()
-        if self.match("-"): return SubNode(lhs, self.parseAddition()).peephole()
-        return lhs
+            Each add sorts its spine of adds (see `AddNode.spline_key`): a
+            new term sinks past every term that sorts above it, rebuilding
+            the adds on its way.  Terms other than constants, Phis of
+            constants and adds sort by node id, to the same place whatever
+            order they come in; each run of them is added deepest first, so
+            none sinks and the run costs linear time.
 
-    def parseMultiplication(self):
+            @param lhs the first term, kept alive
+            @return an add expression `Node`, never `None`
         """
-            multiplicativeExpr : unaryExpr (('*' | '/') unaryExpr)*
+        terms = [lhs]
+        while True:
+            rhs = self.parseBinary(bp)
+            rhs.keep()
+            terms.append(rhs)
+            if self._lexer.text() != "+" or self._lexer.kind() != Parser.Lexer.PUNCT:
+                break
+            self._lexer.advance()
+        if not self.ctx.disable_peephole:
+            i = 0
+            while i < len(terms):
+                j = i
+                while j < len(terms) and self._by_nid(terms[j]):
+                    j += 1
+                # The order the adds sort the terms in, so none has to sink
+                terms[i:j] = sorted(terms[i:j], key=AddNode.spline_key, reverse=True)
+                i = j + 1
+        acc = terms[0].unkeep()
+        for rhs in terms[1:]:
+            acc = AddNode(acc, rhs.unkeep()).peephole()
+        return acc
 
-            @return a multipy expression `Node`, never `None`
-        """
-        lhs = self.parseUnary()
-        if self.match("*"): return MulNode(lhs, self.parseMultiplication()).peephole()
-        if self.match("/"): return DivNode(lhs, self.parseMultiplication()).peephole()
-        return lhs
+    @staticmethod
+    def _by_nid(n):
+        return AddNode.spline_key(n)[0] >= 2 and not isinstance(n, AddNode)
 
     def parseUnary(self):
         """
@@ -233,8 +310,13 @@ class Parser():
 
             @return a unary expression `Node`, never `None`
         """
-        if self.match("-"): return MinusNode(self.parseUnary()).peephole()
-        return self.parsePrimary()
+        negs = 0
+        while self.match("-"):
+            negs += 1
+        n = self.parsePrimary()
+        for i in range(negs):
+            n = MinusNode(n).peephole()
+        return n
 
     def parsePrimary(self):
         """
@@ -306,110 +388,97 @@ class Parser():
     # Lexer Components
 
     class Lexer():
+        """
+            Splits the whole source into tokens once, up front, with a single
+            compiled regex; the parser then walks the token stream.  Every token
+            records its kind, its text and where it starts in the source.
+        """
+        # Token kinds
+        EOF = 0
+        ID = 1
+        NUM = 2
+        PUNCT = 3
+        DIRECTIVE = 4 # e.g. '#showGraph'
+        OTHER = 5     # any other single character
+        _KINDS = {"id": ID, "num": NUM, "punct": PUNCT, "directive": DIRECTIVE, "other": OTHER}
+        _TOKEN = re.compile(r"""
+              (?P<ws>[\x00-\x20]+)
+            | (?P<id>[^\W\d]\w*)
+            | (?P<num>\d+)
+            | (?P<directive>\#[^\W\d]\w*)
+            | (?P<punct>==|!=|<=|>=|[=;\[\]<>()+\-/*{}])
+            | (?P<other>.)
+        """, re.VERBOSE | re.DOTALL)
+
         def __init__(self, source):
             self._input = source
-            self._position = 0
+            self._kinds = array('b')
+            self._texts = []
+            self._starts = array('q')
+            kinds = Parser.Lexer._KINDS
+            for m in Parser.Lexer._TOKEN.finditer(source):
+                kind = m.lastgroup
+                if kind == "ws":
+                    continue
+                self._kinds.append(kinds[kind])
+                self._texts.append(m.group())
+                self._starts.append(m.start())
+            # EOF token
+            self._kinds.append(Parser.Lexer.EOF)
+            self._texts.append("")
+            self._starts.append(len(source))
+            self._position = 0 # index of the current token
 
         def __repr__(self) -> str:
-            return self._input[self._position:len(self._input) - self._position]
+            return self._input[self._starts[self._position]:]
 
         def is_eof(self):
-            return self._position >= len(self._input)
+            return self._kinds[self._position] == Parser.Lexer.EOF
 
-        # use '#' for EOF
-        def peek(self):
-            import sys
-            return chr(sys.maxunicode) if self.is_eof() else str(self._input[self._position])
+        def kind(self):
+            return self._kinds[self._position]
 
-        def nextChar(self):
-            ch = self.peek()
-            self._position = self._position + 1
-            return ch
+        def text(self):
+            return self._texts[self._position]
 
-        def isWhiteSpace(self):
-            return self.peek() <= ' '
+        def advance(self):
+            if not self.is_eof():
+                self._position += 1
 
-        def skipWhiteSpace(self):
-            while self.isWhiteSpace():
-                self._position = self._position + 1
-        
-        # Return true, if we find "syntax" after skipping white space; also
-        # then advance the cursor past syntax.
-        # Return false otherwise, and do not advance the cursor.
+        # Return true, if the next token is "syntax"; also then advance past it.
+        # Return false otherwise, and do not advance.
         def match(self, syntax):
-            self.skipWhiteSpace()
-            lenth = len(syntax)
-            if self._position + lenth > len(self._input):
+            if self._texts[self._position] != syntax or self.is_eof():
                 return False
-            for i in range(lenth):
-                if self._input[self._position + i] != syntax[i]:
-                    return False
-            self._position = self._position + lenth
+            self._position += 1
             return True
-        
+
         def matchx(self, syntax):
-            if not self.match(syntax):
-                return False
-            if not self.isIdLetter(self.peek()):
-                return True
-            self._position = self._position - len(syntax)
-            return False
+            # Tokens are maximal, so an exact match cannot run into more id letters
+            return self.match(syntax)
 
         def peekeq(self, ch:str):
-            self.skipWhiteSpace()
-            return self.peek() == ch
+            return self._texts[self._position] == ch
 
         def matchId(self):
             """
                 Return an identifier or None.
             """
-            self.skipWhiteSpace()
-            return self.parseId() if self.isIdStart(self.peek()) else None
+            if self._kinds[self._position] != Parser.Lexer.ID:
+                return None
+            self._position += 1
+            return self._texts[self._position - 1]
 
         def getAnyNextToken(self):
-            if self.is_eof():
-                return ""
-            if self.isIdStart(self.peek()):
-                return self.parseId()
-            if self.isPunctuation(self.peek()):
-                return self.parsePunctuation()
-            return str(self.peek())
-
-        def isNumber(self, ch=None):
-            if ch is None:
-                ch = self.peek()
-            return ch.isdigit()
+            return self._texts[self._position]
+
+        def isNumber(self):
+            return self._kinds[self._position] == Parser.Lexer.NUM
 
         def parseNumber(self) -> Type:
-            start = self._position
-            ch = self.nextChar()
-            while self.isNumber(ch):
-                ch = self.nextChar()
-            snum = self._input[start:self._position - 1]
-            self._position -= 1
+            snum = self._texts[self._position]
+            self._position += 1
             if len(snum) > 1 and snum[0] == '0':
                 raise Parser.error("Syntax error: integer values cannot start with '0'")
 
             return TypeInteger.constant(int(snum))
-
-        def isIdStart(self, ch: str):
-            return ch.isalpha() or ch == '_'
-
-        def isIdLetter(self, ch: str):
-            return ch.isalpha() or ch.isdigit() or ch == '_'
-
-        def parseId(self):
-            start = self._position
-            ch = self.nextChar()
-            while self.isIdLetter(ch):
-                ch = self.nextChar()
-            parsed_id = self._input[start:self._position - 1]
-            self._position -= 1
-            return parsed_id
-
-        def isPunctuation(self, ch: str):
-            return "=;[]<>()+-/*".find(ch) != -1
-
-        def parsePunctuation(self):
-            start = self._position
-            return self._input[start:start + 1]
@@ -0,0 +1,125 @@
+import json
+from time import perf_counter
+
+class PeepStats():
+    """
+        Counts and times the peephole rules, per node class and rule.
+
+        Off unless a PeepStats is given to the Parser; then every `idealize`
+        call is timed, and the rule that fired is the one named with
+        `Node.rule`.  A call where no rule fires counts as the rule "-".
+        Constant folding and value numbering count as the rules "fold" and
+        "gvn" of the node they replace.
+
+        Times and node counts are exclusive: a rule that peepholes the nodes
+        it makes is not charged for the rules those fire.  Nodes created are
+        node ids handed out; nodes killed are nodes killed during the rule,
+        not the node it replaces, which dies afterwards.  `killed` counts
+        every kill, inside a rule or not.
+
+        A PeepStats may be shared by several parses; it adds up.
+
+            stats = PeepStats(out=sys.stderr)
+            Parser("return arg+1+2;", stats=stats).parse() # prints the table
+            stats.to_json()
+    """
+    MISS = "-"
+
+    def __init__(self, out=None, fmt="table"):
+        """
+            @param out a text file `report` writes to at the end of each
+            parse, or `None` not to report
+            @param fmt "table" or "json"
+        """
+        self.out = out
+        self.fmt = fmt
+        self.rules = {}  # (class name, rule) -> [hits, created, killed, seconds]
+        self.killed = 0
+        self._rule = None
+        self._stack = [] # per running idealize: [seconds, created, killed] of its nested calls
+
+    def idealize(self, n, ctx):
+        """
+            Call `n.idealize()`, charging it to the rule that fires.
+        """
+        self._rule = None
+        self._stack.append([0.0, 0, 0])
+        nid, killed = ctx.node_count(), self.killed
+        st = perf_counter()
+        try:
+            x = n.idealize()
+        finally:
+            t = perf_counter() - st
+            created, killed = ctx.node_count() - nid, self.killed - killed
+            inner = self._stack.pop()
+            if self._stack:
+                outer = self._stack[-1]
+                outer[0] += t
+                outer[1] += created
+                outer[2] += killed
+        rule = self.MISS if x is None else self._rule or "?"
+        self._count(n, rule, t - inner[0], created - inner[1], killed - inner[2])
+        self._rule = None
+        return x
+
+    def hit(self, n, rule):
+        self._count(n, rule, 0.0, 0, 0)
+
+    def _count(self, n, rule, t, created, killed):
+        c = self.rules.get((n.__class__.__name__, rule))
+        if c is None:
+            c = self.rules[(n.__class__.__name__, rule)] = [0, 0, 0, 0.0]
+        c[0] += 1
+        c[1] += created
+        c[2] += killed
+        c[3] += t
+
+    # --------------------------------------
+    # Reports
+
+    def by_class(self):
+        """
+            @return {class name: [hits, created, killed, seconds]}, over all
+            the rules of the class, misses included
+        """
+        classes = {}
+        for (cls, _), c in self.rules.items():
+            s = classes.setdefault(cls, [0, 0, 0, 0.0])
+            for i in range(4):
+                s[i] += c[i]
+        return classes
+
+    def as_dict(self):
+        fields = ("hits", "created", "killed", "seconds")
+        return {
+            "rules": [dict(zip(("class", "rule") + fields, (*k, *c))) for k, c in self._sorted(self.rules)],
+            "classes": [dict(zip(("class",) + fields, (k, *c))) for k, c in self._sorted(self.by_class())],
+            "killed": self.killed,
+        }
+
+    def to_json(self, **kw):
+        return json.dumps(self.as_dict(), **kw)
+
+    def table(self):
+        lines = [f"{'class':<12} {'rule':<16} {'hits':>8} {'created':>8} {'killed':>8} {'ms':>9}"]
+        for (cls, rule), c in self._sorted(self.rules):
+            lines.append(f"{cls:<12} {rule:<16} {c[0]:>8} {c[1]:>8} {c[2]:>8} {c[3] * 1e3:>9.3f}")
+        lines.append("")
+        for cls, c in self._sorted(self.by_class()):
+            lines.append(f"{cls:<12} {'(all)':<16} {c[0]:>8} {c[1]:>8} {c[2]:>8} {c[3] * 1e3:>9.3f}")
+        lines.append(f"{'nodes killed':<29} {self.killed:>26}")
+        return "\n".join(lines)
+
+    def report(self):
+        """
+            Write the table or JSON to `out`, if any.  Called at the end of
+            `Parser.parse`.
+        """
+        if self.out is None:
+            return
+        self.out.write(self.to_json(indent=1) if self.fmt == "json" else self.table())
+        self.out.write("\n")
+
+    def _sorted(self, d):
+        # Most expensive first
+        return sorted(d.items(), key=lambda kc: (-kc[1][3], -kc[1][0], kc[0]))
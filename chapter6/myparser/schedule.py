@@ -0,0 +1,42 @@
+from myparser.node import StopNode
+
+class Schedule():
+    """
+        The nodes reachable from a StopNode by input edges, in an order where
+        every node comes after its inputs.  Inputs are given as indices, slots,
+        into that order, with -1 for a `None` input.
+
+        Computing the order walks the whole graph, so it is done once and
+        shared by everything that runs the program, e.g. the `Interpreter`.
+        The graphs of Simple are acyclic so far (there are no loops), so any
+        such order is a valid execution order: a node may be computed as
+        soon as its inputs are.
+    """
+    def __init__(self, stop: StopNode):
+        order = []
+        slot = {}
+        # Iterative post-order walk, as graphs can be deep
+        stack = [(stop, 0)]
+        on_stack = {stop._nid}
+        while stack:
+            n, i = stack[-1]
+            if i < n.nIns():
+                stack[-1] = (n, i + 1)
+                d = n.In(i)
+                if d is not None and d._nid not in slot:
+                    if d._nid in on_stack:
+                        raise RuntimeError(f"Cannot schedule the cycle through {d.unique_name()}")
+                    on_stack.add(d._nid)
+                    stack.append((d, 0))
+            else:
+                stack.pop()
+                slot[n._nid] = len(order)
+                order.append(n)
+        self.nodes = order
+        self.ins = [tuple(-1 if d is None else slot[d._nid] for d in n._inputs) for n in order]
+        self.stop = slot[stop._nid]
+        # Slots of the ReturnNodes, in StopNode input order
+        self.returns = self.ins[self.stop]
+
+    def __len__(self):
+        return len(self.nodes)
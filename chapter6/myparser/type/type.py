@@ -43,6 +43,10 @@ class Type:
     def __repr__(self) -> str:
         return self._print("")
 
+    def __reduce__(self):
+        # Simple types are singletons; unpickle to the same object
+        return {Type._bot: "BOTTOM", Type._top: "TOP", Type._ctrl: "CONTROL"}[self._type]
+
 BOTTOM = Type(Type._bot)  # ALL
 TOP = Type(Type._top)  # ANY
 CONTROL = Type(Type._ctrl)  # Ctrl
@@ -1,7 +1,22 @@
 from .type import Type
 from typing_extensions import override
+import threading
+import weakref
 
 class TypeInteger(Type):
+    """
+        Integer constants are interned: `constant(x)` always hands back the same
+        object for the same `x` while it is in use, so equality is identity.
+        Do not construct constants directly, use `constant`.
+    """
+    # Small constants are preallocated, see `_SMALL` below.
+    _SMALL_MIN = -128
+    _SMALL_MAX = 1024
+    _SMALL = []
+    # Other constants live here as long as someone holds on to them.
+    _INTERN = weakref.WeakValueDictionary()
+    _INTERN_LOCK = threading.Lock()
+
     def __init__(self, is_con, con):
         super().__init__(self._int)
         self._is_con = is_con
@@ -9,7 +24,15 @@ class TypeInteger(Type):
 
     @classmethod
     def constant(cls, con):
-        return TypeInteger(True, con)
+        if cls._SMALL_MIN <= con < cls._SMALL_MAX:
+            return cls._SMALL[con - cls._SMALL_MIN]
+        t = cls._INTERN.get(con)
+        if t is None:
+            with cls._INTERN_LOCK: # two threads must not intern different objects
+                t = cls._INTERN.get(con)
+                if t is None:
+                    t = cls._INTERN[con] = TypeInteger(True, con)
+        return t
     
     def is_top(self):
         return (not self._is_con and self._con == 0)
@@ -43,18 +66,16 @@ class TypeInteger(Type):
         assert self.is_constant() and other.is_constant()
         return self if self._con == 1 else BOT
 
-    @override
-    def __eq__(self, other):
-        if self is other:
-            return True
-        if not isinstance(other, TypeInteger):
-            return False
-        return self._con == other._con and self._is_con == other._is_con
+    def __reduce__(self):
+        # Unpickle back to the interned instance
+        if self.is_constant(): return (TypeInteger.constant, (self._con,))
+        return "TOP" if self.is_top() else "BOT"
 
     @override
     def __repr__(self) -> str:
         return self._print("")
 
+TypeInteger._SMALL = [TypeInteger(True, con) for con in range(TypeInteger._SMALL_MIN, TypeInteger._SMALL_MAX)]
 TOP = TypeInteger(False, 0)
 BOT = TypeInteger(False, 1)
-ZERO = TypeInteger(True, 0)
\ No newline at end of file
+ZERO = TypeInteger.constant(0)
\ No newline at end of file
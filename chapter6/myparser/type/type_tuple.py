@@ -10,6 +10,10 @@ class TypeTuple(Type):
     def meet(self, other):
         raise NotImplementedError("Meet on Tuple Type not yet implemented")
     
+    @override
+    def __reduce__(self):
+        return "IF" if self is IF else (TypeTuple, (self._types,))
+
     @override
     def _print(self, s):
         s += "[ "
@@ -1,22 +1,170 @@
 class BitVector():
+    """
+        A set of small non-negative ints, one bit each, packed 8 to a byte.
+
+        Grows as needed; bits past the end are clear.  Union, intersection
+        and popcount work on whole words at once, through Python ints.
+
+            live = BitVector(ctx.node_count())
+            live.set(n._nid)
+            if live.get(m._nid): ...
+            for nid in live: ...
+    """
+    __slots__ = ("_bytes",)
+    # The set bits of each byte value
+    _BITS = [tuple(i for i in range(8) if b >> i & 1) for b in range(256)]
+
     def __init__(self, size=None):
-        self.len = 1
-        if size is not None:
-            self.len = size
-        self.bits = [0] * self.len
+        self._bytes = bytearray(((size or 0) + 7) >> 3)
+
+    def get(self, idx) -> bool:
+        i = idx >> 3
+        return i < len(self._bytes) and (self._bytes[i] >> (idx & 7)) & 1 == 1
 
-    def get(self, idx):
-        if idx < self.len:
-            return self.bits[idx]
-        return None
+    __contains__ = get
 
     def set(self, idx):
-        if idx < self.len:
-            self.bits[idx] = 1
-        else:
-            self.len = self.len * 2 # expand the bit set
-            self.bits += [0] * self.len
-            self.set(idx) # call set recursively as expand once may not enough.
+        i = idx >> 3
+        if i >= len(self._bytes):
+            self._grow(i + 1)
+        self._bytes[i] |= 1 << (idx & 7)
 
     def clear(self, idx):
-        self.bits[idx] = 0
\ No newline at end of file
+        i = idx >> 3
+        if i < len(self._bytes):
+            self._bytes[i] &= ~(1 << (idx & 7)) & 0xFF
+
+    def _grow(self, nbytes):
+        # At least double, so a run of increasing sets is linear
+        self._bytes.extend(bytes(max(nbytes, 2 * len(self._bytes)) - len(self._bytes)))
+
+    def capacity(self):
+        """
+            Number of bits held without growing.
+        """
+        return len(self._bytes) << 3
+
+    def count(self):
+        """
+            Number of set bits (popcount).
+        """
+        return self._int().bit_count()
+
+    def __iter__(self):
+        """
+            The set bits, in increasing order.
+        """
+        bits = BitVector._BITS
+        for i, b in enumerate(self._bytes):
+            if b:
+                base = i << 3
+                for k in bits[b]:
+                    yield base + k
+
+    def __bool__(self):
+        return any(self._bytes)
+
+    def __eq__(self, other):
+        return isinstance(other, BitVector) and self._int() == other._int()
+
+    def __repr__(self):
+        return "{" + ",".join(map(str, self)) + "}"
+
+    # --------------------------------------
+    # Word-level set operations
+
+    def _int(self):
+        return int.from_bytes(self._bytes, "little")
+
+    def _assign(self, x, nbytes):
+        self._bytes[:] = x.to_bytes(nbytes, "little")
+
+    @classmethod
+    def _of(cls, x, nbytes):
+        bv = cls()
+        bv._bytes = bytearray(x.to_bytes(nbytes, "little"))
+        return bv
+
+    def __or__(self, other):
+        return BitVector._of(self._int() | other._int(), max(len(self._bytes), len(other._bytes)))
+
+    def __and__(self, other):
+        return BitVector._of(self._int() & other._int(), max(len(self._bytes), len(other._bytes)))
+
+    def __sub__(self, other):
+        return BitVector._of(self._int() & ~other._int(), len(self._bytes))
+
+    def __ior__(self, other):
+        self._assign(self._int() | other._int(), max(len(self._bytes), len(other._bytes)))
+        return self
+
+    def __iand__(self, other):
+        self._assign(self._int() & other._int(), len(self._bytes))
+        return self
+
+    def __isub__(self, other):
+        self._assign(self._int() & ~other._int(), len(self._bytes))
+        return self
+
+    union = __or__
+    intersection = __and__
+    difference = __sub__
+
+
+def inputs(n):
+    return n._inputs
+
+def outputs(n):
+    return n._outputs
+
+def inputs_outputs(n):
+    return n._inputs + n._outputs
+
+class Walker():
+    """
+        Depth-first walks of the graph, with an explicit stack so graphs can
+        be far deeper than the Python stack.
+
+        `edges` picks the neighbors to follow: `inputs`, `outputs` or
+        `inputs_outputs`, or any function of a node returning a sequence
+        of nodes (`None`s are skipped).  Nodes come in the order a recursive
+        walk would visit them, neighbors in sequence order.
+
+        The visited set is a `BitVector` indexed by node id, sized from the
+        id counter of the graph's CompileContext, and shared by every walk
+        of one Walker: a node is produced once, however many roots reach it.
+
+            walker = Walker(parser.ctx.node_count(), inputs)
+            live = list(walker.walk(parser.STOP))
+    """
+    def __init__(self, size, edges=inputs_outputs):
+        self.visited = BitVector(size)
+        self.edges = edges
+
+    def walk(self, root):
+        """
+            Yield the unvisited nodes reachable from root, root first.
+        """
+        visited = self.visited
+        bits = visited._bytes # tested inline, the hot path of every walk
+        edges = self.edges
+        stack = [root]
+        while stack:
+            n = stack.pop()
+            if n is None: continue
+            nid = n._nid
+            i = nid >> 3
+            if i < len(bits):
+                byte = bits[i]
+                if byte >> (nid & 7) & 1: continue
+                bits[i] = byte | 1 << (nid & 7)
+            else: # a node made after the Walker
+                visited.set(nid)
+            yield n
+            ns = edges(n)
+            for i in range(len(ns) - 1, -1, -1):
+                m = ns[i]
+                if m is not None:
+                    mid = m._nid
+                    if (mid >> 3) >= len(bits) or not bits[mid >> 3] >> (mid & 7) & 1:
+                        stack.append(m)
@@ -0,0 +1,71 @@
+import numpy as np
+from myparser.interpreter import Interpreter, CON, ARG, LIVE, ADD, SUB, MUL, DIV, MINUS, NOT, EQL, LTH, LEQ, \
+    IF, IFT, IFF, REGION, PHI, RETURN
+
+class VectorInterpreter(Interpreter):
+    """
+        Runs a parsed program for a whole array of `arg` values at once.
+        Needs NumPy, an optional requirement (see requirements.txt).
+
+        The schedule is the `Interpreter`'s, but every value is an int64
+        array with one lane per `arg`, and control is a boolean mask of the
+        lanes that reach a node, all false for a missing control input.
+        Both sides of an If are computed for all lanes; a PhiNode selects per
+        lane with `np.where` on the masks of its Region's inputs, and so does
+        the choice between ReturnNodes.
+
+        Values are int64, so unlike the `Interpreter` arithmetic wraps on
+        overflow.
+
+            run = VectorInterpreter(parser.parse())
+            run(np.arange(1_000_000))
+    """
+    def run(self, args) -> np.ndarray:
+        arg = np.asarray(args, dtype=np.int64)
+        code = self._code
+        vals = [None] * len(code)
+        i = 0
+        for op, a, b in code:
+            if op == ADD: v = vals[a] + vals[b]
+            elif op == MUL: v = vals[a] * vals[b]
+            elif op == CON: v = np.int64(a)
+            elif op == SUB: v = vals[a] - vals[b]
+            elif op == ARG: v = arg
+            elif op == PHI:
+                rins = code[a][1]
+                v = np.int64(0)
+                for k in range(len(b) - 1, 0, -1):
+                    if rins[k] >= 0:
+                        v = np.where(vals[rins[k]], vals[b[k]], v)
+            elif op == EQL: v = (vals[a] == vals[b]).astype(np.int64)
+            elif op == LTH: v = (vals[a] < vals[b]).astype(np.int64)
+            elif op == LEQ: v = (vals[a] <= vals[b]).astype(np.int64)
+            elif op == DIV:
+                d = vals[b]
+                v = np.where(d != 0, vals[a] // np.where(d == 0, 1, d), 0)
+            elif op == MINUS: v = -vals[a]
+            elif op == NOT: v = (vals[a] == 0).astype(np.int64)
+            elif op == IF: # The masks of both sides, for the projections
+                c = vals[a] if a >= 0 else np.False_
+                t = vals[b] != 0
+                v = (c & t, c & ~t)
+            elif op == IFT: v = vals[a][0]
+            elif op == IFF: v = vals[a][1]
+            elif op == REGION:
+                v = np.False_
+                for k in a[1:]:
+                    if k >= 0: v = v | vals[k]
+            elif op == RETURN: v = vals[a] if a >= 0 else np.False_
+            elif op == LIVE: v = np.True_
+            else: v = None
+            vals[i] = v
+            i += 1
+        # The first Return reached wins, so select from the last one back
+        out = np.zeros(arg.shape, dtype=np.int64)
+        reached = np.zeros(arg.shape, dtype=bool)
+        for r, e in reversed(self._returns):
+            out = np.where(vals[r], vals[e], out)
+            reached |= vals[r]
+        if not reached.all():
+            raise RuntimeError("No return reached")
+        return out
@@ -5,10 +5,32 @@ cur_dir = os.path.dirname(os.path.abspath(__file__))
 sys.path.append(cur_dir + "/../")
 from myparser.parser import Parser
 from myparser.graph_visualizer import GraphVisualizer
-from myparser.node import Node, ConstantNode, ProjNode, AddNode
+from myparser.node import Node, ConstantNode, ProjNode, AddNode, SubNode
 from myparser.type import TypeInteger, BOT
+from myparser.iter_peeps import IterPeeps
+from myparser.graph import Graph
+try:
+    import numpy
+except ImportError: # Optional, for the VectorInterpreter
+    numpy = None
 
 class TestParser(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        import tempfile
+        from myparser.graph_renderer import GraphRenderer
+        # Render the #showGraph snapshots into a directory removed after the tests
+        cls.graphs = tempfile.TemporaryDirectory()
+        cls.renderer = GraphRenderer(cls.graphs.name)
+        cls.shared = GraphRenderer.set_shared(cls.renderer)
+
+    @classmethod
+    def tearDownClass(cls):
+        from myparser.graph_renderer import GraphRenderer
+        GraphRenderer.set_shared(cls.shared)
+        cls.renderer.close(wait=False)
+        cls.graphs.cleanup()
+
     def test_chapter5_ifstmt(self):
         parser = Parser(
         """
@@ -155,6 +177,536 @@ class TestParser(unittest.TestCase):
         with self.assertRaisesRegex(RuntimeError, ref_msg):
             Parser("int a=1; ififif(arg)inta=2;return a;").parse()
     
+    def test_gvn(self):
+        parser = Parser("int a=arg+1; int b=arg+1; return a==b;")
+        ret = parser.parse()
+        self.assertEqual("return 1;", ret.print())
+
+    def test_gvn_swap(self):
+        parser = Parser("int x=1+arg; int y=arg+1; return x*y;")
+        ret = parser.parse()
+        ret_node = ret.ret()
+        self.assertIs(ret_node.expr().In(1), ret_node.expr().In(2))
+        self.assertEqual("return ((arg+1)*(arg+1));", ret.print())
+
+    def test_gvn_shared_operand(self):
+        # (arg-80) is one node; folding the compare must not kill the lhs of '*'
+        parser = Parser("return (arg-80)*((arg-80)<(arg-80));")
+        self.assertEqual("return ((arg-80)*0);", parser.parse().print())
+        parser = Parser("return ((arg-80)*((arg==((arg-80)<(arg-80)))>(arg-80)));")
+        self.assertEqual("return ((arg-80)*((arg-80)<(arg==0)));", parser.parse().print())
+
+    def test_gvn_kill(self):
+        parser = Parser("int a=arg*3; a=arg; return arg*3;")
+        ret = parser.parse()
+        self.assertEqual("return (arg*3);", ret.print())
+        for n in parser.ctx.gvn.values():
+            self.assertFalse(n.is_dead())
+
+    def test_iter_peeps_deferred(self):
+        src = "int a=arg*2; int b=arg*3; int c=arg*4; return ((1+c)+b)+(a+2);"
+        ref = Parser(src).parse().print()
+        parser = Parser(src)
+        depth = Node.MAX_PEEPHOLE_DEPTH
+        Node.MAX_PEEPHOLE_DEPTH = 1
+        try:
+            ret = parser.parse()
+        finally:
+            Node.MAX_PEEPHOLE_DEPTH = depth
+        self.assertEqual(ref, ret.print())
+        self.assertEqual(0, len(parser.ctx.work))
+
+    def test_iter_peeps_whole_graph(self):
+        parser = Parser("int a=arg+1; if( arg==1 ) a=a+2; return a+3;")
+        stop = parser.parse()
+        ref = stop.print()
+        with parser.ctx:
+            IterPeeps.add_all(stop)
+            IterPeeps.iterate(stop)
+        self.assertEqual(ref, stop.print())
+
+    def test_iter_peeps_budget(self):
+        parser = Parser("return arg+1;")
+        stop = parser.parse()
+        with parser.ctx:
+            IterPeeps.add_all(stop)
+            IterPeeps.iterate(stop, budget=2)
+            self.assertGreater(len(parser.ctx.work), 0)
+            IterPeeps.iterate(stop)
+        self.assertEqual(0, len(parser.ctx.work))
+
+    def test_type_integer_interned(self):
+        import pickle
+        self.assertIs(TypeInteger.constant(3), TypeInteger.constant(1+2))
+        big = TypeInteger.constant(10**12)
+        self.assertIs(big, TypeInteger.constant(10**12))
+        self.assertNotEqual(TypeInteger.constant(3), TypeInteger.constant(4))
+        self.assertIs(big, pickle.loads(pickle.dumps(big)))
+        self.assertIs(BOT, pickle.loads(pickle.dumps(BOT)))
+
+    def test_del_use_multiset(self):
+        import random
+        from collections import Counter
+        parser = Parser("return arg;")
+        start = parser.START
+        with parser.ctx:
+            uses = [ConstantNode(TypeInteger.constant(i)) for i in range(40)]
+        for use in uses[:10]:
+            start.add_use(use) # used twice
+        start.keep()
+        expect = Counter(start._outputs)
+        rnd = random.Random(5)
+        order = list(start._outputs)
+        rnd.shuffle(order)
+        for use in order:
+            start.del_use(use)
+            expect[use] -= 1
+            self.assertEqual(+expect, Counter(start._outputs))
+            for i, n in enumerate(start._outputs):
+                ps = start._out_pos[n]
+                self.assertIn(i, ps if isinstance(ps, list) else [ps])
+        self.assertTrue(start.isUnused())
+        self.assertTrue(start.del_use(None))
+
+    def test_graph_arena(self):
+        import pickle
+        parser = Parser("int a=arg+1; int b=0; if( arg==1 ) b=a; else b=a+1; return a+b;")
+        stop = parser.parse()
+        g = pickle.loads(pickle.dumps(Graph.build(stop)))
+        self.assertEqual(stop._nid, g.nid[g.stop()])
+        nodes = g.materialize()
+        self.assertEqual(stop.print(), nodes[g.stop()].print())
+        self.assertEqual(len(g), len(g.sweep()))
+
+    def test_graph_arena_sweep(self):
+        parser = Parser("return arg;")
+        stop = parser.parse()
+        with parser.ctx:
+            dead = ConstantNode(TypeInteger.constant(7))
+        g = Graph.build(stop)
+        self.assertNotEqual(-1, g.row(dead._nid))
+        swept = g.sweep()
+        self.assertEqual(len(g) - 1, len(swept))
+        self.assertEqual(-1, swept.row(dead._nid))
+        self.assertEqual("return arg;", swept.materialize()[swept.stop()].print())
+
+    def test_lexer_tokens(self):
+        lexer = Parser.Lexer("int a1=0;#showGraph\n if(a1<=2)")
+        tokens = []
+        while not lexer.is_eof():
+            tokens.append((lexer.kind(), lexer.text()))
+            lexer.advance()
+        L = Parser.Lexer
+        self.assertEqual([(L.ID, "int"), (L.ID, "a1"), (L.PUNCT, "="), (L.NUM, "0"), (L.PUNCT, ";"),
+                          (L.DIRECTIVE, "#showGraph"), (L.ID, "if"), (L.PUNCT, "("), (L.ID, "a1"),
+                          (L.PUNCT, "<="), (L.NUM, "2"), (L.PUNCT, ")")], tokens)
+
+    def test_lexer_compare(self):
+        self.assertEqual("return 1;", Parser("return 3<=3;").parse().print())
+        self.assertEqual("return (arg<=3);", Parser("return arg<=3;").parse().print())
+
+    def test_binary_left_assoc(self):
+        self.assertEqual("return 5;", Parser("return 10-3-2;").parse().print())
+        self.assertEqual("return 2;", Parser("return 12/3/2;").parse().print())
+        self.assertEqual("return 0;", Parser("return 3>3;").parse().print())
+        self.assertEqual("return 1;", Parser("return 3>=3;").parse().print())
+        self.assertEqual("return (3<arg);", Parser("return arg>3;").parse().print())
+
+    def test_binary_long_chain(self):
+        n = 5000
+        ret = Parser("return " + "+".join(["1"] * n) + ";").parse()
+        self.assertEqual(f"return {n};", ret.print())
+        # A left-deep chain of subtracts
+        stop = Parser("return arg" + "-1" * n + ";").parse()
+        sub = stop.ret().expr()
+        for i in range(n):
+            self.assertIsInstance(sub, SubNode)
+            sub = sub.In(1)
+        self.assertIsInstance(sub, ProjNode)
+        # Printing it walks the chain with an explicit stack
+        expect = "return " + "(" * n + "arg" + "-1)" * n + ";"
+        self.assertEqual(expect, stop.print())
+        self.assertEqual(expect, stop.print(dag=True))
+
+    def test_binary_long_sum(self):
+        from myparser.peep_stats import PeepStats
+        # Every term sorts along the spine of adds; sinking them was quadratic
+        n = 5000
+        stats = PeepStats()
+        ret = Parser("return " + "+".join(f"arg*{i+2}" for i in range(n)) + ";", stats=stats).parse()
+        self.assertNotIn(("AddNode", "add-sort-spine"), stats.rules)
+        self.assertEqual(n - 1, stats.by_class()["AddNode"][0])
+        add = ret.ret().expr()
+        muls = []
+        while isinstance(add, AddNode):
+            muls.append(add.In(2).In(2)._con.value())
+            add = add.In(1)
+        muls.append(add.In(2)._con.value())
+        self.assertEqual(list(range(2, n + 2)), muls)
+
+    def test_compile_context_interleaved(self):
+        p1 = Parser("int a=arg+1; return a*2;")
+        p2 = Parser("if( arg==1 ) return 3; else return 4;")
+        s2 = p2.parse()
+        s1 = p1.parse()
+        self.assertEqual("return ((arg+1)*2);", s1.print())
+        self.assertEqual("Stop[ return 3; return 4; ]", s2.print())
+        self.assertIs(p1.START, s1.ret().ctrl().ctrl())
+        self.assertIsNot(p1.START, p2.START)
+
+    def test_compile_context_threads(self):
+        from concurrent.futures import ThreadPoolExecutor
+        srcs = [f"int a=arg+{i}; if( arg=={i} ) a=a*{i}; return a;" for i in range(1, 41)]
+        ref = [Parser(src).parse().print() for src in srcs]
+        with ThreadPoolExecutor(8) as pool:
+            got = list(pool.map(lambda src: Parser(src).parse().print(), srcs))
+        self.assertEqual(ref, got)
+
+    def test_compile_many(self):
+        from myparser.batch import compile_many, compile_stream
+        srcs = [f"int a=arg+{i}; if( arg=={i} ) a=a*2; return a;" for i in range(20)]
+        srcs[7] = "return 1-;"
+        res = compile_many(srcs, workers=2, chunksize=3)
+        self.assertEqual(list(range(20)), [r.index for r in res])
+        self.assertEqual("return Phi(Region16,(arg*2),arg);", res[0].printed)
+        self.assertEqual(Parser(srcs[3]).parse().print(), res[3].printed)
+        self.assertIsNone(res[7].printed)
+        self.assertEqual("Syntax error, expected an identifier or expression: ;", res[7].error)
+        self.assertEqual(res, compile_many(srcs, workers=0))
+        self.assertEqual(res, sorted(compile_stream(srcs, workers=2, chunksize=1)))
+
+    def test_print_dag(self):
+        ret = Parser("int a=arg+1; return a*a;").parse()
+        self.assertEqual("return ((arg+1)*(arg+1));", ret.print())
+        self.assertEqual("let Add7=(arg+1); return (Add7*Add7);", ret.print(dag=True))
+        # Leaves and a Region are never bound
+        ret = Parser("int a=1; if( arg==1 ) a=2; return a+a;").parse()
+        self.assertEqual(ret.print(), ret.print(dag=True))
+
+    def test_print_dag_deep(self):
+        src = "int a0=arg+1; " + "".join(f"int a{i+1}=a{i}*a{i}; " for i in range(40)) + "return a40;"
+        out = Parser(src).parse().print(dag=True)
+        self.assertEqual(40, out.count("let "))
+        self.assertTrue(out.endswith("let Mul46=(Mul45*Mul45); return (Mul46*Mul46);"))
+
+    def test_graph_visualizer_stream(self):
+        import io
+        parser = Parser("int a=arg+1; int b=0; if( arg==1 ) b=a*2; return b+a;")
+        parser.parse()
+        out = io.StringIO()
+        GraphVisualizer().write_dot(parser, out)
+        dot = out.getvalue()
+        self.assertEqual(GraphVisualizer().generate_dot_output(parser), dot)
+        self.assertIn("{ rank=same; Region17;Phi_b18;}", dot)
+        # Deeper than the Python stack
+        src = "int a=arg; " + "a=a*arg; " * 3000 + "return a;"
+        parser = Parser(src)
+        parser.parse()
+        dot = GraphVisualizer().generate_dot_output(parser)
+        self.assertEqual(3000, dot.count("label=\"*\""))
+
+    def test_graph_renderer(self):
+        import tempfile
+        from myparser.graph_renderer import GraphRenderer
+        with tempfile.TemporaryDirectory() as tmp:
+            renderer = GraphRenderer(tmp, keep=2)
+            renderer.COMMAND = [sys.executable, "-c", "import shutil,sys; shutil.copy(sys.argv[1], sys.argv[2])", "{dot}", "{out}"]
+            parser = Parser("int a=arg+1; #showGraph; return a; #showGraph;")
+            parser.renderer = renderer
+            parser.parse(show=True)
+            self.assertTrue(renderer.flush(30))
+            renderer.close()
+            self.assertEqual((3, 3, 0), (renderer.submitted, renderer.rendered, renderer.failed))
+            # Only the last two snapshots are kept
+            self.assertEqual(4, len(os.listdir(tmp)))
+            pngs = sorted(f for f in os.listdir(tmp) if f.endswith(".png"))
+            self.assertEqual(2, len(pngs))
+            with open(os.path.join(tmp, pngs[0])) as f:
+                self.assertIn("int a=arg+1;", f.read())
+
+    def test_graph_renderer_policy(self):
+        import tempfile
+        import threading
+        from myparser.graph_renderer import GraphRenderer
+        class Gated(GraphRenderer):
+            def __init__(self, directory, policy):
+                self.started = threading.Event()
+                self.gate = threading.Event()
+                self.seen = []
+                super().__init__(directory, max_pending=2, policy=policy)
+            def render(self, dot_path, out_path):
+                self.started.set()
+                self.gate.wait()
+                with open(dot_path) as f:
+                    self.seen.append(f.read())
+                return True
+        for policy, expect in (("coalesce", ["0", "3", "4"]), ("drop", ["0", "1", "2"])):
+            with tempfile.TemporaryDirectory() as tmp:
+                r = Gated(tmp, policy)
+                r.submit("0")
+                self.assertTrue(r.started.wait(30)) # Worker took "0" and waits on the gate
+                paths = [r.submit(str(i)) for i in range(1, 5)]
+                # Dropped snapshots leave no file
+                self.assertEqual(3, len(os.listdir(tmp)))
+                r.gate.set()
+                r.close()
+                self.assertEqual(expect, r.seen)
+                self.assertEqual(2, r.dropped)
+                self.assertEqual(policy == "drop", paths[-1] is None)
+
+    def test_interpreter(self):
+        from myparser.interpreter import Interpreter
+        run = Interpreter(Parser("if( arg==1 ) return 3; int a=arg*2; if( arg<5 ) a=a+1; return a;").parse())
+        self.assertEqual([1, 3, 5, 7, 9, 10, 12], [run(x) for x in range(7)])
+        run = Interpreter(Parser("int a=arg/3; int b=-arg; if( arg>2 ) { b=b*a; if( arg!=7 ) b=100; } return b-a;").parse())
+        self.assertEqual([0, 99, -16, 98], [run(x) for x in (0, 4, 7, 8)])
+        self.assertEqual(0, Interpreter(Parser("return 7/arg;").parse())(0))
+        self.assertEqual(5, Interpreter(Parser("return 5;").parse())(9))
+        # The If after the return has no control
+        run = Interpreter(Parser("return 1; if( arg==2 ) return 5; else return 6;").parse())
+        self.assertEqual([1, 1, 1], [run(x) for x in range(3)])
+
+    @unittest.skipUnless(numpy, "needs NumPy")
+    def test_vector_interpreter(self):
+        from myparser.interpreter import Interpreter
+        from myparser.vector_interpreter import VectorInterpreter
+        for src in ["if( arg==1 ) return 3; int a=arg*2; if( arg<5 ) a=a+1; return a;",
+                    "int a=arg/3; int b=-arg; if( arg>2 ) { b=b*a; if( arg!=7 ) b=100; } return b-a;",
+                    "return 7/(arg-2);", "return 5;",
+                    "return 1; if( arg==2 ) return 5; else return 6;"]:
+            stop = Parser(src).parse()
+            run = Interpreter(stop)
+            args = numpy.arange(-20, 20)
+            self.assertEqual([run(x) for x in range(-20, 20)], VectorInterpreter(stop)(args).tolist())
+
+    def test_codegen(self):
+        from myparser.interpreter import Interpreter
+        from myparser.codegen import CodeGen
+        f = CodeGen(Parser("if( arg==1 ) return 3; return arg+2;").parse()).function()
+        self.assertEqual("def f(arg):\n    if arg == 1:\n        return 3\n    else:\n        return (arg + 2)\n", f.source)
+        for src in ["if( arg==1 ) return 3; int a=arg*2; if( arg<5 ) a=a+1; return a;",
+                    "int a=1; if( arg==1 ) { if( arg<3 ) a=2; else return 7; } else a=5; return a;",
+                    "int a=arg/3; int b=-arg; if( arg>2 ) { b=b*a; if( arg!=7 ) b=100; } return b-a;",
+                    "int a=arg+1; int b=a*a; if( arg<b ) { if( b<10 ) a=b/a; else a=3; } else b=b+a; return a+b;",
+                    "return 7/(arg-2);", "return arg==3;",
+                    "int a=1; if( arg==1 ) a=2; return arg;", "if( arg==1 ) return 3; else return 4; return 5;"]:
+            stop = Parser(src).parse()
+            run = Interpreter(stop)
+            f = CodeGen(stop).function()
+            self.assertEqual([run(x) for x in range(-10, 12)], [f(x) for x in range(-10, 12)])
+        # Long chains are assigned a node a line, not nested in one expression
+        for src in ["return arg" + "-1" * 2000 + ";", "return " + "+".join(f"arg*{i+2}" for i in range(2000)) + ";"]:
+            stop = Parser(src).parse()
+            run = Interpreter(stop)
+            f = CodeGen(stop).function()
+            self.assertEqual([run(x) for x in (-3, 0, 7)], [f(x) for x in (-3, 0, 7)])
+
+    def test_compile_cache(self):
+        import tempfile
+        from myparser.compile_cache import CompileCache
+        src = "int a=arg+1; if( arg==1 ) a=a*2; return a;"
+        ref = Parser(src).parse().print()
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = CompileCache(max_entries=2, directory=tmp)
+            s1 = cache.parse(src)
+            s2 = cache.parse(src)
+            self.assertIsNot(s1, s2)
+            self.assertEqual([ref, ref], [s1.print(), s2.print()])
+            self.assertEqual((1, 1), (cache.hits, cache.misses))
+            self.assertEqual("return Phi(Region20,8,4);", cache.parse(src, TypeInteger.constant(3)).print())
+            cache.parse("return 1;")
+            self.assertEqual(2, len(cache._mem))
+            # A second cache over the same directory
+            other = CompileCache(directory=tmp)
+            self.assertEqual(ref, other.parse(src).print())
+            self.assertEqual((1, 0), (other.disk_hits, other.misses))
+            size = max(os.path.getsize(os.path.join(tmp, f)) for f in os.listdir(tmp))
+            small = CompileCache(directory=tmp, max_bytes=size)
+            small.parse("return 2;")
+            self.assertEqual(1, len(os.listdir(tmp)))
+            # A hit comes with its own context, to go on optimizing in
+            stop, ctx = cache.compile(src)
+            self.assertIs(stop, ctx.stop)
+            top = max(Graph.build(stop).nid)
+            with ctx:
+                IterPeeps.add_all(stop)
+                IterPeeps.iterate(stop)
+                self.assertGreater(ConstantNode(TypeInteger.constant(1))._nid, top)
+            self.assertEqual(ref, stop.print())
+        # Entries are plain data, checked when read: a bad one is a miss and is replaced
+        import io
+        import pickle
+        from myparser.graph_file import GraphFile
+        g = Graph.build(Parser(src).parse())
+        g.ins[3] = len(g) + 5
+        hostile = io.BytesIO()
+        GraphFile.write(g, hostile)
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = CompileCache(directory=tmp)
+            cache.parse(src)
+            path = cache._path(cache.key(src))
+            with open(path, "rb") as f:
+                good = f.read()
+            for bad in (pickle.dumps(g), good[:-4], hostile.getvalue()):
+                with open(path, "wb") as f:
+                    f.write(bad)
+                other = CompileCache(directory=tmp)
+                self.assertEqual(ref, other.parse(src).print())
+                self.assertEqual(1, other.misses)
+                with open(path, "rb") as f:
+                    self.assertEqual(good, f.read())
+
+    def test_graph_file(self):
+        import tempfile
+        from myparser.graph_file import GraphFile
+        from myparser.interpreter import Interpreter
+        from myparser.type import IF
+        src = "int a=arg/3; int b=-arg; if( arg>2 ) { b=b*a; if( arg!=7 ) b=100000000000*100000000000; } return b-a;"
+        stop = Parser(src).parse()
+        g = Graph.build(stop)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "prog.son")
+            with open(path, "wb") as f:
+                GraphFile.write(g, f)
+            with GraphFile(path) as h:
+                self.assertEqual(list(g.nid), list(h.nid))
+                self.assertEqual(list(g.ins), list(h.ins))
+                self.assertEqual([None] * len(h.types), h.types._cache) # Nothing decoded yet
+                self.assertEqual(len(h), h.reachable().count(1))
+                nodes = h.materialize()
+                copy = nodes[h.stop()]
+                big = nodes[h.row(stop.ret().expr().In(1).In(1).In(1)._nid)]
+            self.assertEqual(stop.print(), copy.print())
+            self.assertEqual(Interpreter(stop)(8), Interpreter(copy)(8))
+            self.assertIs(TypeInteger.constant(100000000000 * 100000000000), big._con)
+            self.assertTrue(any(n._type is IF for n in nodes))
+            with open(path, "rb") as f:
+                data = f.read()
+            for bad, msg in ((b"junk" * 8, "Not a version 1 graph file"), (b"", "Not a version 1"),
+                             (data[:-8], "Truncated"), (data[:40], "Truncated"), (data + bytes(4), "Trailing")):
+                with open(path, "wb") as f:
+                    f.write(bad)
+                with self.assertRaisesRegex(ValueError, msg):
+                    GraphFile(path)
+
+    def test_peep_stats(self):
+        import io
+        import json
+        from myparser.peep_stats import PeepStats
+        out = io.StringIO()
+        stats = PeepStats(out=out, fmt="json")
+        ret = Parser("return 1+arg+2+(arg*1);", stats=stats).parse()
+        self.assertEqual("return ((arg*2)+3);", ret.print())
+        rules = stats.rules
+        self.assertEqual(1, rules[("AddNode", "add-fold")][0])
+        self.assertEqual(1, rules[("AddNode", "add-same")][0])
+        self.assertEqual(1, rules[("MulNode", "mul-one")][0])
+        self.assertTrue(rules[("AddNode", "-")][0] > 0)
+        self.assertTrue(rules[("AddNode", "add-fold")][1] > 0)
+        report = json.loads(out.getvalue())
+        self.assertEqual(stats.killed, report["killed"])
+        self.assertEqual(sum(c[0] for c in rules.values()), sum(c["hits"] for c in report["classes"]))
+        self.assertIn("add-fold", stats.table())
+        # Off by default
+        parser = Parser("return 1+arg+2;")
+        parser.parse()
+        self.assertIsNone(parser.ctx.stats)
+
+    def test_walker(self):
+        from myparser.utils import Walker, inputs, outputs
+        # Far deeper than the Python stack
+        parser = Parser("int a=arg; " + "a=a*arg-1; " * 3000 + "return a;")
+        stop = parser.parse()
+        self.assertEqual(6006, len(GraphVisualizer().find_all(parser)))
+        nid = parser.ctx.node_count() - 5
+        self.assertEqual(nid, parser.find(nid)._nid)
+        self.assertIsNone(parser.find(10**6))
+        walker = Walker(parser.ctx.node_count(), inputs)
+        self.assertEqual(["Stop", "Return", "$ctrl", "Start", "sub", "Mul"],
+                         [n.label() for n in walker.walk(stop)][:6])
+        self.assertEqual([], list(walker.walk(stop))) # Already visited
+        self.assertEqual(["Start", "$ctrl", "Return", "Stop", "arg"],
+                         [n.label() for n in Walker(10, outputs).walk(parser.START)][:5])
+
+    def test_bit_vector(self):
+        from myparser.utils import BitVector
+        a = BitVector()
+        for i in (0, 3, 9, 100, 1000):
+            a.set(i)
+        b = BitVector(16)
+        b.set(3)
+        b.set(15)
+        self.assertEqual([0, 3, 9, 100, 1000], list(a))
+        self.assertEqual((5, True, False, False), (a.count(), a.get(9), a.get(10), a.get(10**6)))
+        self.assertEqual([0, 3, 9, 15, 100, 1000], list(a | b))
+        self.assertEqual([3], list(a & b))
+        self.assertEqual([0, 9, 100, 1000], list(a - b))
+        c = BitVector()
+        c |= a
+        c &= b
+        self.assertEqual(BitVector(1), c - BitVector(8) - b)
+        a.clear(1000)
+        a.clear(10**9)
+        self.assertEqual("{0,3,9,100}", repr(a))
+        self.assertFalse(BitVector(100))
+
+    def test_scope_dup(self):
+        from myparser.node import ScopeNode
+        parser = Parser(
+        """
+        int a=1; int b=arg; int c=2;
+        if (arg==1) { int x=arg*3; a=x; { int y=x+1; c=y; } if (arg<5) b=7; else { b=a; } }
+        else { int z=arg; b=z+1; }
+        return a+b*c;""")
+        self.assertEqual("return (Phi(Region29,(arg*3),1)+(Phi(Region29,Phi(Region25,7,(arg*3)),(arg+1))*Phi(Region29,((arg*3)+1),2)));",
+                         parser.parse().print())
+        with parser.ctx:
+            scope = ScopeNode()
+            scope.push()
+            scope.define(ScopeNode.CTRL, parser.START)
+            for name in "abc":
+                scope.define(name, ConstantNode(TypeInteger.constant(ord(name))).peephole())
+            dup = scope.dup()
+            self.assertEqual(1, dup.nIns()) # Only its own $ctrl
+            scope.update("b", parser.START)
+            self.assertEqual([98, 98], [dup.lookup("b")._con.value(), dup.binding(2)._con.value()])
+            self.assertIs(scope.lookup("a"), dup.lookup("a"))
+            self.assertEqual(2, dup.nIns())
+
+    def test_scope_names(self):
+        from myparser.node import ScopeNode, PhiNode
+        parser = Parser("return arg;")
+        with parser.ctx:
+            scope = ScopeNode()
+            scope.push()
+            scope.define(ScopeNode.CTRL, parser.START)
+            for name in "abc":
+                scope.define(name, ConstantNode(TypeInteger.constant(ord(name))).peephole())
+            dup = scope.dup()
+            dup.push()
+            dup.define("d", parser.START)
+            self.assertEqual(["$ctrl", "a", "b", "c", "d"], dup.reverse_names())
+            dup.pop()
+            dup.update("c", parser.START)
+            scope.update("b", parser.START)
+            self.assertEqual([0, 2, 3], sorted(dup._own)) # Rebound on either side
+            scope.merge_scopes(dup)
+            phis = [scope.binding(i) for i in (2, 3)]
+            self.assertTrue(all(isinstance(phi, PhiNode) for phi in phis))
+            self.assertEqual(["b", "c"], [phi._label for phi in phis])
+            self.assertEqual(["$ctrl", "a", "b", "c"], scope.reverse_names())
+
+    def test_scope_shadow(self):
+        parser = Parser(
+        """
+        int a=1;
+        { int a=2; { int b=a; { int a=b+arg; b=a; } a=b; } a=a+1; if (arg) { int a=5; } else a=a*2; }
+        return a;""")
+        self.assertEqual("return 1;", parser.parse().print())
+        self.assertEqual({}, parser._scope._index) # Every level popped
+        parser = Parser("int a=1; { int a=arg; { a=a+2; } return a; }")
+        self.assertEqual("return (arg+2);", parser.parse().print())
+
     def test_chapter4_peephole(self):
         parser = Parser("return 1+arg+2; #showGraph;")
         ret = parser.parse()
@@ -255,9 +807,8 @@ class TestParser(unittest.TestCase):
 
     def test_chapter3_var_scope_nopeephole(self):
         parser = Parser("int a=1; int b=2; int c=0; { int b=3; c=a+b; #showGraph; } return c; #showGraph;")
-        Node._disablePeephole = True
+        parser.ctx.disable_peephole = True
         ret = parser.parse()
-        Node._disablePeephole = False
         self.assertEqual("return (1+3);", ret.print())
 
     def test_chapter3_var_dist(self):
@@ -273,12 +824,11 @@ class TestParser(unittest.TestCase):
 
     def test_chapter2_parser_grammar(self):
         parser = Parser("return 1+2*3+-5; #showGraph;")
-        Node._disablePeephole = True
+        parser.ctx.disable_peephole = True
         ret = parser.parse()
-        self.assertEqual("return (1+((2*3)+(-5)));", ret.print())
+        self.assertEqual("return ((1+(2*3))+(-5));", ret.print())
         #gv = GraphVisualizer()
         #print(gv.generate_dot_output(parser))
-        Node._disablePeephole = False
 
     def test_chapter2_add_peephole(self):
         parser = Parser("return 1+2;")